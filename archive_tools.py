@@ -0,0 +1,172 @@
+import json
+import os
+
+import numpy as np
+
+import embedding_cache
+
+# The columns of an archive: name, type of one value, and whether a row holds one value per parameter
+ARCHIVE_COLUMNS = [('parameters', np.float32, True), ('fitness', np.float64, False), ('dodging', np.uint8, False),
+                   ('images', 'S40', False), ('mask', 'S40', False)]
+
+
+class EvaluationArchive:
+    def __init__(self, path, number_of_parameters, writable=True):
+        """
+        An append-only record of every evaluated particle. Every column is kept in its own file in the directory path,
+        so new rows are appended to the files and the columns can be memory-mapped
+        :param path: the directory of the archive. Created if it does not exist and the archive is writable
+        :param number_of_parameters: the number of parameters of a particle
+        :param writable: if False, the archive must exist and is only read. Rows that another run is still appending
+        are left alone
+        """
+        self.path = path
+        self.number_of_parameters = number_of_parameters
+        self.writable = writable
+
+        index_path = os.path.join(path, 'archive.json')
+        if os.path.exists(index_path):
+            with open(index_path) as index_file:
+                if json.load(index_file)['parameters'] != number_of_parameters:
+                    raise ValueError('The archive was created for another number of parameters!')
+        elif not writable:
+            raise IOError('There is no archive at ' + path + '!')
+        else:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            with open(index_path, 'w') as index_file:
+                json.dump({'parameters': number_of_parameters}, index_file)
+
+        # Rows that were not written to every column are left over from an interrupted append (or are still being
+        # appended by another run) and are not used
+        self.length = min(os.path.getsize(self.column_path(name)) // self.row_size(name)
+                          if os.path.exists(self.column_path(name)) else 0 for name, _, _ in ARCHIVE_COLUMNS)
+        if writable:
+            for name, _, _ in ARCHIVE_COLUMNS:
+                with open(self.column_path(name), 'ab') as column_file:
+                    column_file.truncate(self.length * self.row_size(name))
+
+    def column_path(self, name):
+        return os.path.join(self.path, name + '.bin')
+
+    def row_size(self, name):
+        """
+        Returns the number of bytes of a row of a column
+        :param name: the name of the column
+        :return: the number of bytes
+        """
+        for column_name, value_type, per_parameter in ARCHIVE_COLUMNS:
+            if column_name == name:
+                return np.dtype(value_type).itemsize * (self.number_of_parameters if per_parameter else 1)
+
+    def __len__(self):
+        return self.length
+
+    def append(self, positions, fitness, dodging, images_key, mask_key):
+        """
+        Adds evaluated particles
+        :param positions: matrix containing the parameters of one particle per row
+        :param fitness: the fitness of every particle
+        :param dodging: whether the particles were evaluated for dodging
+        :param images_key: identifies the source and target images (see data_key)
+        :param mask_key: identifies the mask (see data_key)
+        :return: nothing
+        """
+        if not self.writable:
+            raise IOError('The archive was opened read-only!')
+
+        rows = len(fitness)
+        values = {'parameters': positions, 'fitness': fitness, 'dodging': [int(dodging)] * rows,
+                  'images': [images_key] * rows, 'mask': [mask_key] * rows}
+        for name, value_type, _ in ARCHIVE_COLUMNS:
+            with open(self.column_path(name), 'ab') as column_file:
+                column_file.write(np.ascontiguousarray(values[name], dtype=value_type).tobytes())
+        self.length += rows
+
+    def column(self, name):
+        """
+        Memory-maps a column
+        :param name: the name of the column
+        :return: an array with one row per archived particle
+        """
+        for column_name, value_type, per_parameter in ARCHIVE_COLUMNS:
+            if column_name == name:
+                shape = (self.length, self.number_of_parameters) if per_parameter else (self.length,)
+                if self.length == 0:
+                    return np.zeros(shape, dtype=value_type)
+                return np.memmap(self.column_path(name), dtype=value_type, mode='r', shape=shape)
+
+    def best(self, count, dodging, mask_key):
+        """
+        Returns the best distinct particles that were evaluated with the same mode and mask
+        :param count: the maximum number of particles
+        :param dodging: the mode
+        :param mask_key: identifies the mask (see data_key)
+        :return: a matrix containing the parameters of one particle per row, the best first
+        """
+        matching = np.nonzero((self.column('dodging') == int(dodging)) &
+                              (self.column('mask') == mask_key.encode('ascii')))[0]
+        matching = matching[np.argsort(self.column('fitness')[matching], kind='mergesort')]
+
+        parameters = self.column('parameters')
+        chosen = list()
+        seen = set()
+        for row in matching:
+            if len(chosen) == count:
+                break
+            row_key = parameters[row].tobytes()
+            if row_key not in seen:
+                seen.add(row_key)
+                chosen.append(row)
+
+        return np.array(parameters[chosen], dtype=float).reshape((len(chosen), self.number_of_parameters))
+
+
+class ArchivingEvaluator:
+    def __init__(self, evaluator, archive, dodging, images_key, mask_key):
+        """
+        Objective function for swarm_tools.pso that adds every particle evaluated by another objective function to an
+        EvaluationArchive. Particles without an exact fitness (see SwarmEvaluator) are left out
+        :param evaluator: the real objective function, e.g. a SwarmEvaluator
+        :param archive: the EvaluationArchive
+        :param dodging: whether the objective function is for dodging
+        :param images_key: identifies the source and target images (see data_key)
+        :param mask_key: identifies the mask (see data_key)
+        """
+        self.evaluator = evaluator
+        self.archive = archive
+        self.dodging = dodging
+        self.images_key = images_key
+        self.mask_key = mask_key
+        self.exact = None
+
+    def __call__(self, swarm_parameters, thresholds=None):
+        """
+        Returns the objective values of the particles and archives them
+        :param swarm_parameters: matrix containing the generator parameters of one particle per row
+        :param thresholds: passed on to the real objective function
+        :return: the objective value of every particle
+        """
+        if thresholds is None:
+            fitness = self.evaluator(swarm_parameters)
+        else:
+            fitness = self.evaluator(swarm_parameters, thresholds)
+
+        exact = getattr(self.evaluator, 'exact', None)
+        if exact is None:
+            exact = np.ones(len(fitness), dtype=bool)
+        self.exact = exact
+
+        archived = exact & np.isfinite(fitness)
+        self.archive.append(swarm_parameters[archived], fitness[archived], self.dodging, self.images_key,
+                            self.mask_key)
+        return fitness
+
+
+def data_key(images):
+    """
+    Calculates a hash of a list of images, e.g. to find the particles that were evaluated with the same mask
+    :param images: the list of images
+    :return: a hex string of 40 characters
+    """
+    return embedding_cache.image_key(np.array(images))
@@ -0,0 +1,55 @@
+#!/usr/bin/env th
+--
+-- Binary counterpart of openface_server.lua from the openFace project, used by torch_backend.py.
+-- Reads batches from stdin: a native int32 count K, followed by K images of imgDim x imgDim x 3 RGB uint8 values.
+-- Writes K representations as native float32 values to stdout. Stops at the end of stdin
+--
+
+require 'torch'
+require 'nn'
+require 'dpnn'
+
+torch.setdefaulttensortype('torch.FloatTensor')
+
+local cmd = torch.CmdLine()
+cmd:text()
+cmd:text('Calculate representations of image batches.')
+cmd:text()
+cmd:option('-model', '', 'Path to the network model.')
+cmd:option('-imgDim', 96, 'Image dimension.')
+cmd:option('-cuda', false)
+cmd:text()
+
+local opt = cmd:parse(arg or {})
+
+local net = torch.load(opt.model)
+net:evaluate()
+
+if opt.cuda then
+   require 'cutorch'
+   require 'cunn'
+   net = net:cuda()
+end
+
+local imageBytes = opt.imgDim * opt.imgDim * 3
+local input = torch.DiskFile('/dev/stdin', 'r'):binary():quiet()
+local output = torch.DiskFile('/dev/stdout', 'w'):binary()
+
+while true do
+   local count = input:readInt()
+   if input:hasError() then
+      break
+   end
+
+   -- HWC bytes to the CHW values between 0 and 1 that image.load returns
+   local bytes = torch.ByteTensor(input:readByte(count * imageBytes))
+   local batch = bytes:view(count, opt.imgDim, opt.imgDim, 3):permute(1, 4, 2, 3):float():div(255)
+   if opt.cuda then
+      batch = batch:cuda()
+   end
+
+   -- The network keeps its output buffer between calls, so it may be larger than this batch
+   local reps = net:forward(batch):float():clone()
+   output:writeFloat(reps:storage())
+   output:synchronize()
+end
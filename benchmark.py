@@ -0,0 +1,175 @@
+import argparse
+import json
+import platform
+import sys
+import timeit
+
+import numpy as np
+
+import evaluation_tools
+import image_tools
+import neural_network_tools
+
+
+class StubNeuralNet:
+    def __init__(self, seed=0):
+        """
+        Deterministic stand-in for openface.TorchNeuralNet that runs in-process.
+        Maps an IMAGE_DIM x IMAGE_DIM x 3 image to a normalized representation of length 128 with a fixed random
+        projection, so benchmarks can run without the openface models
+        :param seed: seed for the projection
+        """
+        image_size = neural_network_tools.IMAGE_DIM * neural_network_tools.IMAGE_DIM * 3
+        self.projection = np.random.RandomState(seed).randn(image_size, 128).astype(np.float32)
+
+    def forward(self, rgbImg):
+        rep = np.dot(rgbImg.reshape(-1).astype(np.float32) / 255.0, self.projection).astype(np.float64)
+        return rep / np.linalg.norm(rep)
+
+
+def create_synthetic_images(count, random_state):
+    """
+    Creates random images with the size expected by the neural network
+    :param count: the number of images
+    :param random_state: the numpy RandomState to draw from
+    :return: a list of uint8 images
+    """
+    return [random_state.randint(0, 256, (neural_network_tools.IMAGE_DIM, neural_network_tools.IMAGE_DIM, 3))
+            .astype(np.uint8) for _ in range(0, count)]
+
+
+def create_synthetic_mask():
+    """
+    Creates a mask like images/barMask.png: a band over the eyes, as loaded by image_tools.load_image
+    :return: the mask
+    """
+    mask = np.zeros((neural_network_tools.IMAGE_DIM, neural_network_tools.IMAGE_DIM, 1), dtype=np.float32)
+    mask[0:38, ...] = 255
+    return mask
+
+
+def create_swarm(particles, random_state):
+    """
+    Creates random particle positions within the bounds of create_fooling_pattern
+    :param particles: the number of particles
+    :param random_state: the numpy RandomState to draw from
+    :return: a matrix containing the parameters of one particle per row
+    """
+    (lower_bounds, upper_bounds) = image_tools.create_fooling_pattern_bounds()
+    return lower_bounds + random_state.rand(particles, len(lower_bounds)) * (upper_bounds - lower_bounds)
+
+
+def measure(name, function, repeat, images=None, particles=None, evaluations=1):
+    """
+    Times a function and prints the result
+    :param name: the name of the benchmark
+    :param function: the function to time. Called without arguments
+    :param repeat: how often the function is called
+    :param images: the number of source and target images, if relevant
+    :param particles: the number of particles, if relevant
+    :param evaluations: the number of particle evaluations done by one call
+    :return: a dictionary describing the result
+    """
+    timings = list()
+    for _ in range(0, repeat):
+        call_start = timeit.default_timer()
+        function()
+        timings.append(timeit.default_timer() - call_start)
+
+    result = {'benchmark': name, 'images': images, 'particles': particles, 'repeat': repeat,
+              'mean_seconds': float(np.mean(timings)), 'min_seconds': float(np.min(timings)),
+              'seconds_per_evaluation': float(np.min(timings)) / evaluations}
+    print('{:62s} images {:>4} particles {:>5} min {:10.6f} s mean {:10.6f} s per evaluation {:10.6f} s'.format(
+        name, str(images or '-'), str(particles or '-'), result['min_seconds'], result['mean_seconds'],
+        result['seconds_per_evaluation']))
+    return result
+
+
+# Main program start: Argument paring
+parser = argparse.ArgumentParser()
+parser.add_argument('--images', type=int, nargs='+', help="Numbers of images to benchmark with.", default=[1, 3, 5])
+parser.add_argument('--particles', type=int, nargs='+', help="Swarm sizes to benchmark with.", default=[1, 10, 100])
+parser.add_argument('--repeat', type=int, help="Number of times every benchmark is run.", default=5)
+parser.add_argument('--output', help="JSON file the results are written to.", default=None)
+parser.add_argument('--baseline', help="JSON file of an earlier run to compare the results to.", default=None)
+parser.add_argument('--tolerance', type=float,
+                    help="Factor by which a benchmark may be slower than the baseline before it counts as a regression.",
+                    default=1.2)
+args = parser.parse_args()
+
+random_generator = np.random.RandomState(0)
+nn = neural_network_tools.NeuralNetworkTools(net=StubNeuralNet())
+mask = create_synthetic_mask()
+renderer = image_tools.FoolingPatternRenderer(neural_network_tools.IMAGE_DIM)
+single_parameters = create_swarm(1, random_generator)[0]
+single_pattern = renderer(neural_network_tools.IMAGE_DIM, single_parameters)
+(image1, image2) = create_synthetic_images(2, random_generator)
+
+results = list()
+
+# Single stages
+results.append(measure('image_tools.blend', lambda: image_tools.blend(image1, single_pattern, mask), args.repeat))
+results.append(measure('image_tools.create_fooling_pattern',
+                       lambda: image_tools.create_fooling_pattern(neural_network_tools.IMAGE_DIM, single_parameters),
+                       args.repeat))
+results.append(measure('FoolingPatternRenderer',
+                       lambda: renderer(neural_network_tools.IMAGE_DIM, single_parameters), args.repeat))
+results.append(measure('NeuralNetworkTools.calculate_likeness', lambda: nn.calculate_likeness(image1, image2),
+                       args.repeat))
+
+for number_of_images in args.images:
+    sources = create_synthetic_images(number_of_images, random_generator)
+    targets = create_synthetic_images(number_of_images, random_generator)
+    target_embeddings = nn.embed_images(targets)
+
+    results.append(measure('NeuralNetworkTools.calculate_likenesses',
+                           lambda: nn.calculate_likenesses(sources, targets, mask, single_pattern), args.repeat,
+                           images=number_of_images))
+    results.append(measure('NeuralNetworkTools.calculate_likenesses (precalculated targets)',
+                           lambda: nn.calculate_likenesses(sources, targets, mask, single_pattern,
+                                                           target_embeddings=target_embeddings),
+                           args.repeat, images=number_of_images))
+
+    # Full evaluations of a swarm, as done in every iteration of the optimization
+    evaluator = evaluation_tools.SwarmEvaluator(nn, sources, targets, mask, renderer, False,
+                                                target_embeddings=target_embeddings, fitness_cache_size=0)
+    for number_of_particles in args.particles:
+        swarm = create_swarm(number_of_particles, random_generator)
+        patterns = renderer.render_many(swarm)
+        blend_kernel = image_tools.BlendKernel(sources, mask)
+
+        results.append(measure('FoolingPatternRenderer.render_many', lambda: renderer.render_many(swarm),
+                               args.repeat, images=number_of_images, particles=number_of_particles,
+                               evaluations=number_of_particles))
+        results.append(measure('FoolingPatternRenderer.render_many (mask rows)',
+                               lambda: renderer.render_many(swarm, rows=blend_kernel.rows), args.repeat,
+                               images=number_of_images, particles=number_of_particles,
+                               evaluations=number_of_particles))
+        results.append(measure('BlendKernel.blend_many', lambda: blend_kernel.blend_many(patterns), args.repeat,
+                               images=number_of_images, particles=number_of_particles,
+                               evaluations=number_of_particles))
+        results.append(measure('SwarmEvaluator', lambda: evaluator(swarm), args.repeat, images=number_of_images,
+                               particles=number_of_particles, evaluations=number_of_particles))
+
+if args.output is not None:
+    with open(args.output, 'w') as output_file:
+        json.dump({'python': platform.python_version(), 'numpy': np.__version__, 'results': results}, output_file,
+                  indent=2)
+
+if args.baseline is not None:
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)['results']
+    baseline_timings = dict(((result['benchmark'], result['images'], result['particles']),
+                             result['seconds_per_evaluation']) for result in baseline)
+
+    regressions = 0
+    for result in results:
+        key = (result['benchmark'], result['images'], result['particles'])
+        if key in baseline_timings and result['seconds_per_evaluation'] > args.tolerance * baseline_timings[key]:
+            regressions += 1
+            print('Regression: {} (images {}, particles {}) takes {:.6f} s per evaluation, was {:.6f} s'.format(
+                result['benchmark'], result['images'], result['particles'], result['seconds_per_evaluation'],
+                baseline_timings[key]))
+
+    if regressions > 0:
+        sys.exit(1)
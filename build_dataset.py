@@ -0,0 +1,27 @@
+import argparse
+import time
+
+import dataset_tools
+
+# Main program start: Argument paring
+parser = argparse.ArgumentParser()
+parser.add_argument('input', help="Directory containing the photos. Subdirectories are included.")
+parser.add_argument('output', help="Path of the dataset, without extension. Creates output.npy and output.json.")
+parser.add_argument('--workers', type=int, help="Number of processes that align the faces.", default=1)
+args = parser.parse_args()
+
+start = time.time()
+paths = dataset_tools.find_images(args.input)
+print("Aligning {} photos.".format(len(paths)))
+
+
+def report_progress(processed):
+    if processed % 100 == 0 or processed == len(paths):
+        print("Aligned {} of {} photos in {:.1f} seconds.".format(processed, len(paths), time.time() - start))
+
+
+dataset = dataset_tools.build_dataset(paths, args.output, workers=args.workers, progress=report_progress)
+
+for path in dataset.failed:
+    print("No face found in " + path)
+print("Wrote {} faces to {}.npy.".format(len(dataset), args.output))
@@ -0,0 +1,15 @@
+import argparse
+import time
+
+import daemon_tools
+
+# Main program start: Argument paring
+start = time.time()
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--socket', help="Path of the Unix socket the jobs are sent to.", default='optimization.sock')
+args = parser.parse_args()
+
+server = daemon_tools.OptimizationServer(args.socket)
+print("Startup took {:.1f} seconds.".format(time.time() - start))
+server.serve()
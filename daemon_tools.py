@@ -0,0 +1,171 @@
+import json
+import os
+import socket
+import time
+import traceback
+
+import numpy as np
+
+import dataset_tools
+import evaluation_tools
+import image_tools
+import neural_network_tools
+import swarm_tools
+
+# The settings of a job that are not given by the client
+JOB_DEFAULTS = {'particles': 100, 'iterations': 10, 'images': 1, 'dodging': False, 'sources': None, 'targets': None,
+                'mask': dataset_tools.MASK_PATH, 'seed': None, 'fitness_cache': evaluation_tools.FITNESS_CACHE_SIZE,
+                'racing': 0}
+
+
+class OptimizationServer:
+    def __init__(self, socket_path, nn=None):
+        """
+        Runs optimization jobs sent to a Unix socket. The neural network, the fooling pattern renderer and all images
+        that were used once stay loaded between jobs. Jobs are run one after another.
+        Every connection sends one job as a line of JSON (see JOB_DEFAULTS for its keys) and receives one line of JSON
+        with 'status' 'ok' and the 'result' of run_job, or 'status' 'error' and a 'message'.
+        A job {'command': 'shutdown'} stops the server
+        :param socket_path: the path of the Unix socket. An existing file at this path is replaced
+        :param nn: the NeuralNetworkTools object to use. Created if not given
+        """
+        self.socket_path = socket_path
+        self.nn = nn
+        if nn is None:
+            self.nn = neural_network_tools.NeuralNetworkTools()
+        self.fooling_generator = image_tools.FoolingPatternRenderer(neural_network_tools.IMAGE_DIM)
+        self.images = dict()
+        self.masks = dict()
+
+    def serve(self):
+        """
+        Accepts jobs until a shutdown command is received
+        :return: nothing
+        """
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+        server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            server_socket.bind(self.socket_path)
+            server_socket.listen(8)
+            print("Waiting for jobs on " + self.socket_path)
+
+            running = True
+            while running:
+                connection = server_socket.accept()[0]
+                try:
+                    running = self.handle(connection)
+                finally:
+                    connection.close()
+        finally:
+            server_socket.close()
+            os.remove(self.socket_path)
+
+    def handle(self, connection):
+        """
+        Reads one job from a connection and answers it
+        :param connection: the accepted socket
+        :return: False if the server should stop
+        """
+        running = True
+        try:
+            # Empty or malformed requests are answered with an error like failed jobs, they must not stop the server
+            connection_file = connection.makefile('rb')
+            try:
+                job = json.loads(connection_file.readline().decode('utf-8'))
+            finally:
+                connection_file.close()
+            if not isinstance(job, dict):
+                raise ValueError('A job must be a JSON object!')
+
+            if job.get('command') == 'shutdown':
+                running = False
+                response = {'status': 'ok', 'result': None}
+            else:
+                response = {'status': 'ok', 'result': self.run_job(job)}
+        except Exception as e:
+            traceback.print_exc()
+            response = {'status': 'error', 'message': str(e)}
+
+        try:
+            connection.sendall((json.dumps(response) + '\n').encode('utf-8'))
+        except socket.error:
+            # The client did not wait for the response
+            pass
+        return running
+
+    def load_faces(self, count, dataset_path, default_paths):
+        """
+        Like dataset_tools.load_faces, but keeps the faces for later jobs
+        """
+        key = (count, dataset_path, tuple(default_paths))
+        if key not in self.images:
+            self.images[key] = dataset_tools.load_faces(count, dataset_path, default_paths)
+        return self.images[key]
+
+    def load_mask(self, path):
+        """
+        Like image_tools.load_image for a mask, but keeps the mask for later jobs
+        """
+        if path not in self.masks:
+            self.masks[path] = image_tools.load_image(path, 1)
+        return self.masks[path]
+
+    def run_job(self, job):
+        """
+        Runs one optimization like main.py
+        :param job: a dictionary with the settings of the job. Missing settings are taken from JOB_DEFAULTS
+        :return: a dictionary containing the 'fitness' and 'parameters' of the best fooling pattern, the 'likenesses'
+        between the fooled sources and the targets (or the sources for dodging) and the run time in 'seconds'
+        """
+        job_start = time.time()
+        settings = dict(JOB_DEFAULTS)
+        settings.update(job)
+        print("Running job " + json.dumps(settings, sort_keys=True))
+
+        source_images = self.load_faces(settings['images'], settings['sources'], dataset_tools.SOURCE_PATHS)
+        target_images = self.load_faces(settings['images'], settings['targets'], dataset_tools.TARGET_PATHS)
+        mask = self.load_mask(settings['mask'])
+
+        comparison_images = target_images
+        if settings['dodging']:
+            comparison_images = source_images
+
+        (lower_bounds, upper_bounds) = image_tools.create_fooling_pattern_bounds()
+        optimization_function = evaluation_tools.SwarmEvaluator(
+            self.nn, source_images, comparison_images, mask, self.fooling_generator, settings['dodging'],
+            target_embeddings=self.nn.embed_images(comparison_images, cached=True),
+            fitness_cache_size=settings['fitness_cache'], racing_sources=settings['racing'])
+        xopt, fopt = swarm_tools.pso(optimization_function, lower_bounds, upper_bounds, maxiter=settings['iterations'],
+                                     swarmsize=settings['particles'], minfunc=1e-3, phig=2.0, phip=2.0,
+                                     random_state=np.random.RandomState(settings['seed']),
+                                     thresholds=settings['racing'] > 0)
+
+        fooling_pattern = self.fooling_generator(neural_network_tools.IMAGE_DIM, xopt)
+        likenesses = self.nn.calculate_likenesses(source_images, comparison_images, mask, fooling_pattern)
+        return {'fitness': float(fopt), 'parameters': [float(value) for value in xopt],
+                'likenesses': [float(value) for value in likenesses], 'seconds': time.time() - job_start}
+
+
+def submit_job(socket_path, job):
+    """
+    Sends a job to an OptimizationServer and waits for the result
+    :param socket_path: the path of the server's Unix socket
+    :param job: a dictionary with the settings of the job (see JOB_DEFAULTS)
+    :return: the result of the job
+    """
+    client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client_socket.connect(socket_path)
+        connection_file = client_socket.makefile('rwb')
+        connection_file.write((json.dumps(job) + '\n').encode('utf-8'))
+        connection_file.flush()
+        response = json.loads(connection_file.readline().decode('utf-8'))
+        connection_file.close()
+    finally:
+        client_socket.close()
+
+    if response['status'] != 'ok':
+        raise RuntimeError('The job failed: ' + response['message'])
+    return response['result']
@@ -0,0 +1,143 @@
+import json
+import multiprocessing
+import os
+
+import numpy as np
+
+import image_tools
+import neural_network_tools
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+# The images in the images folder, used when no dataset is given
+SOURCE_PATHS = ['images/source2.png', 'images/source4.png', 'images/source5.png', 'images/source1.png',
+                'images/source3.png']
+TARGET_PATHS = ['images/target1.png', 'images/target2.png', 'images/target5.png', 'images/target3.png',
+                'images/target4.png']
+MASK_PATH = 'images/barMask.png'
+
+
+class FaceDataset:
+    def __init__(self, path):
+        """
+        A set of aligned faces written by build_dataset. The faces are memory-mapped, so only the ones that are used
+        are read from disk
+        :param path: the path of the dataset files, without extension
+        """
+        with open(path + '.json') as index_file:
+            index = json.load(index_file)
+        self.names = index['names']
+        self.failed = index['failed']
+        self.images = np.load(path + '.npy', mmap_mode='r')
+
+    def __len__(self):
+        return len(self.names)
+
+    def select(self, count, offset=0):
+        """
+        Returns some of the faces
+        :param count: the number of faces
+        :param offset: the index of the first face
+        :return: a list of count 96x96x3 images
+        """
+        if offset + count > len(self):
+            raise ValueError('The dataset only contains {} faces!'.format(len(self)))
+        return list(self.images[offset:offset + count])
+
+
+def load_faces(count, dataset_path=None, default_paths=SOURCE_PATHS):
+    """
+    Loads the first faces of a dataset, or of a list of image files if no dataset is given
+    :param count: the number of faces
+    :param dataset_path: the path of a dataset written by build_dataset, without extension
+    :param default_paths: the image files that are used without a dataset
+    :return: a list of count 96x96x3 images
+    """
+    if dataset_path is not None:
+        return FaceDataset(dataset_path).select(count)
+    return [image_tools.load_image(default_paths[i], 3) for i in range(0, count)]
+
+
+def find_images(directory):
+    """
+    Lists the image files in a directory and its subdirectories
+    :param directory: the directory
+    :return: the sorted paths of the images
+    """
+    paths = list()
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, filename))
+    return sorted(paths)
+
+
+def build_dataset(paths, output_path, workers=1, progress=None):
+    """
+    Aligns the faces in a set of photos and writes them to output_path.npy (one 96x96x3 uint8 image per face) and
+    output_path.json (the names of the photos). Photos without a face that can be aligned are left out. Any other error,
+    e.g. a photo that cannot be read, is raised. Both files are replaced atomically
+    :param paths: the paths of the photos
+    :param output_path: the path of the dataset files, without extension
+    :param workers: the number of processes that align the faces. Each one loads its own face aligner
+    :param progress: function that is called with the number of photos processed so far
+    :return: the FaceDataset
+    """
+    image_shape = (neural_network_tools.IMAGE_DIM, neural_network_tools.IMAGE_DIM, 3)
+
+    # np.save appends .npy to names without it, so the temporary file has to end in .npy as well
+    temporary_matrix_path = output_path + '.tmp.npy'
+    images = np.lib.format.open_memmap(temporary_matrix_path, mode='w+', dtype=np.uint8,
+                                       shape=(len(paths),) + image_shape)
+
+    names = list()
+    failed = list()
+    pool = multiprocessing.Pool(workers, initializer=_init_worker)
+    try:
+        for i, (path, aligned_face) in enumerate(pool.imap(_align_photo, paths, chunksize=8)):
+            if aligned_face is None:
+                failed.append(path)
+            else:
+                images[len(names)] = aligned_face
+                names.append(path)
+            if progress is not None:
+                progress(i + 1)
+    finally:
+        pool.close()
+        pool.join()
+
+    # Drop the rows of the photos that failed
+    images.flush()
+    del images
+    if len(names) < len(paths):
+        aligned_images = np.load(temporary_matrix_path, mmap_mode='r')[0:len(names)]
+        compact_matrix_path = output_path + '.compact.tmp.npy'
+        np.save(compact_matrix_path, aligned_images)
+        del aligned_images
+        os.rename(compact_matrix_path, temporary_matrix_path)
+    os.rename(temporary_matrix_path, output_path + '.npy')
+
+    temporary_index_path = output_path + '.json.tmp'
+    with open(temporary_index_path, 'w') as index_file:
+        json.dump({'names': names, 'failed': failed}, index_file)
+    os.rename(temporary_index_path, output_path + '.json')
+
+    return FaceDataset(output_path)
+
+
+# The face aligner of a worker process, created once by _init_worker
+_worker_aligner = None
+
+
+def _init_worker():
+    global _worker_aligner
+    _worker_aligner = neural_network_tools.load_aligner()
+
+
+def _align_photo(path):
+    # Only photos without a face are left out. Other errors, like unreadable files, stop build_dataset
+    img = image_tools.load_image(path, 3)
+    try:
+        return path, neural_network_tools.align_face(_worker_aligner, img)
+    except neural_network_tools.FaceNotFoundError:
+        return path, None
@@ -0,0 +1,365 @@
+import base64
+import json
+import multiprocessing
+import socket
+import struct
+import threading
+import traceback
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import numpy as np
+
+import evaluation_tools
+import image_tools
+import neural_network_tools
+import profiling_tools
+
+DISTRIBUTED_BATCH_SIZE = 10
+# Workers are not authenticated, so only workers on this machine can connect unless another address is given
+COORDINATOR_HOST = '127.0.0.1'
+BATCH_ATTEMPTS = 3
+
+
+class DistributedSwarmEvaluator:
+    def __init__(self, port, sources, targets, mask, dodging, host=COORDINATOR_HOST, batch_size=DISTRIBUTED_BATCH_SIZE,
+                 local_workers=0, progress=None, fitness_cache_size=evaluation_tools.FITNESS_CACHE_SIZE, timer=None,
+                 racing_sources=0, attempts=BATCH_ATTEMPTS, timeout=None):
+        """
+        Objective function for swarm_tools.pso. Listens on a TCP port for workers (see run_worker), which can join at
+        any time, and hands out the swarm in batches. Every worker receives the images once and keeps its own
+        NeuralNetworkTools. The batch of a worker that disconnects or fails is given to another worker, until it has
+        been tried too often.
+        The workers use a FoolingPatternRenderer, and every particle is evaluated exactly as by SwarmEvaluator
+        :param port: the TCP port to listen on
+        :param sources: Source images (they get masked)
+        :param targets: Target images. For dodging, these are the unmasked source images
+        :param mask: The mask
+        :param dodging: if True, the likeness is maximized instead of minimized
+        :param host: the address to listen on. '' listens on all interfaces. Workers are not authenticated, so anyone
+        who can reach the port can send fitness values
+        :param batch_size: the number of particles sent to a worker at once
+        :param local_workers: the number of worker processes started on this machine
+        :param progress: function that is called with the number of evaluated particles whenever a batch is finished
+        :param fitness_cache_size: the size of the fitness cache of every worker. 0 disables the cache
+        :param timer: the profiling_tools.StageTimer that receives the time the workers spent in each stage. Created
+        if not given
+        :param racing_sources: the number of sources particles are first evaluated on (see SwarmEvaluator)
+        :param attempts: the number of times a batch is sent to a worker before the evaluation fails
+        :param timeout: the number of seconds to wait for the next result from the workers before the evaluation
+        fails. None waits until a worker connects
+        """
+        self.batch_size = batch_size
+        self.attempts = attempts
+        self.timeout = timeout
+        self.progress = progress
+
+        self.timer = timer
+        if timer is None:
+            self.timer = profiling_tools.StageTimer()
+        self.fitness_cache_hits = 0
+        self.fitness_cache_misses = 0
+        self.forwards = 0
+        self.skipped_forwards = 0
+        self.exact = None
+
+        self.setup = {'type': 'setup', 'sources': encode_array(np.array(sources)),
+                      'targets': encode_array(np.array(targets)), 'mask': encode_array(mask), 'dodging': dodging,
+                      'fitness_cache_size': fitness_cache_size, 'racing_sources': racing_sources}
+
+        self.batches = queue.Queue()
+        self.results = queue.Queue()
+        self.worker_threads = list()
+        self.swarm_number = 0
+
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((host, port))
+        self.server_socket.listen(16)
+        self.accept_thread = threading.Thread(target=self.accept_workers)
+        self.accept_thread.daemon = True
+        self.accept_thread.start()
+
+        # Local workers connect to the address the port was opened on, which is only localhost for all interfaces
+        (local_host, local_port) = self.server_socket.getsockname()[0:2]
+        if local_host == '0.0.0.0':
+            local_host = 'localhost'
+        self.local_processes = list()
+        for _ in range(0, local_workers):
+            process = multiprocessing.Process(target=run_worker, args=(local_host, local_port))
+            process.daemon = True
+            process.start()
+            self.local_processes.append(process)
+
+    def __call__(self, swarm_parameters, thresholds=None):
+        """
+        Returns the average likeness of the masked sources to the targets for every particle
+        :param swarm_parameters: matrix containing the generator parameters of one particle per row
+        :param thresholds: the fitness every particle has to get below. Only used for racing (see SwarmEvaluator)
+        :return: Average likeness of every particle (-1 * average likeness for dodging)
+        :raises RuntimeError: if a batch failed on too many workers, or no result arrived within the timeout
+        """
+        self.swarm_number += 1
+        batch_starts = range(0, len(swarm_parameters), self.batch_size)
+        for batch_number, batch_start in enumerate(batch_starts):
+            batch_end = batch_start + self.batch_size
+            batch_thresholds = None
+            if thresholds is not None:
+                batch_thresholds = [float(value) for value in thresholds[batch_start:batch_end]]
+            self.batches.put({'type': 'batch', 'swarm': self.swarm_number, 'batch': batch_number, 'attempts': 0,
+                              'parameters': np.asarray(swarm_parameters[batch_start:batch_end]).tolist(),
+                              'thresholds': batch_thresholds})
+
+        results = dict()
+        exact = dict()
+        evaluated = 0
+        while len(results) < len(batch_starts):
+            try:
+                result = self.results.get(timeout=self.timeout)
+            except queue.Empty:
+                self.discard_batches()
+                raise RuntimeError('No worker returned a result for {} seconds!'.format(self.timeout))
+            if result['swarm'] != self.swarm_number:
+                continue
+            if 'error' in result:
+                self.discard_batches()
+                raise RuntimeError('Batch {} failed {} times, last with:\n{}'.format(result['batch'], self.attempts,
+                                                                                     result['error']))
+
+            results[result['batch']] = np.array(result['fitness'])
+            exact[result['batch']] = np.array(result['exact'], dtype=bool)
+            (hits, misses, forwards, skipped_forwards) = result['statistics']
+            self.fitness_cache_hits += hits
+            self.fitness_cache_misses += misses
+            self.forwards += forwards
+            self.skipped_forwards += skipped_forwards
+            evaluated += result['evaluated']
+            for stage, (seconds, calls) in result['stage_timings'].items():
+                self.timer.add(stage, seconds, calls)
+            if self.progress is not None:
+                self.progress(len(result['fitness']))
+
+        fitness = np.concatenate([results[batch_number] for batch_number in range(0, len(batch_starts))])
+        self.exact = np.concatenate([exact[batch_number] for batch_number in range(0, len(batch_starts))])
+        self.timer.record(fitness, evaluated)
+        return fitness
+
+    def accept_workers(self):
+        """
+        Accepts workers until close() is called. Every worker is served by its own thread
+        :return: nothing
+        """
+        while True:
+            try:
+                connection, address = self.server_socket.accept()
+            except socket.error:
+                return
+
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            worker_thread = threading.Thread(target=self.serve_worker, args=(connection, address))
+            worker_thread.daemon = True
+            worker_thread.start()
+            self.worker_threads.append(worker_thread)
+
+    def serve_worker(self, connection, address):
+        """
+        Sends batches to a worker until close() is called or the worker disconnects
+        :param connection: the socket of the worker
+        :param address: the address of the worker
+        :return: nothing
+        """
+        print("Worker {} connected.".format(address))
+        batch = None
+        try:
+            send_message(connection, self.setup)
+            while True:
+                batch = self.batches.get()
+                if batch is None:
+                    send_message(connection, {'type': 'stop'})
+                    return
+
+                send_message(connection, batch)
+                result = receive_message(connection)
+                if 'error' in result:
+                    print("Worker {} failed to evaluate a batch.".format(address))
+                    self.retry_batch(batch, result['error'])
+                else:
+                    result['swarm'] = batch['swarm']
+                    result['batch'] = batch['batch']
+                    self.results.put(result)
+                batch = None
+        except (socket.error, EOFError):
+            print("Worker {} disconnected.".format(address))
+            if batch is not None:
+                self.retry_batch(batch, 'The worker disconnected.')
+        finally:
+            connection.close()
+
+    def retry_batch(self, batch, error):
+        """
+        Gives a batch that was not evaluated to the next worker, or reports the error to __call__ if the batch has
+        been tried too often
+        :param batch: the batch message
+        :param error: the reason why the batch was not evaluated
+        :return: nothing
+        """
+        batch['attempts'] += 1
+        if batch['attempts'] < self.attempts:
+            self.batches.put(batch)
+        else:
+            self.results.put({'swarm': batch['swarm'], 'batch': batch['batch'], 'error': error})
+
+    def discard_batches(self):
+        """
+        Removes the batches that were not yet sent to a worker, after the evaluation of the swarm failed
+        :return: nothing
+        """
+        while True:
+            try:
+                self.batches.get_nowait()
+            except queue.Empty:
+                return
+
+    def cache_statistics(self):
+        """
+        Returns how many patterns were found in the fitness caches of all workers
+        :return: a tuple of hits and misses
+        """
+        return self.fitness_cache_hits, self.fitness_cache_misses
+
+    def racing_statistics(self):
+        """
+        Returns how many images the workers passed through the network, and how many were skipped by racing
+        :return: a tuple of forwards and skipped forwards
+        """
+        return self.forwards, self.skipped_forwards
+
+    def close(self):
+        """
+        Stops the workers and closes the port
+        :return: nothing
+        """
+        self.server_socket.close()
+        for _ in self.worker_threads:
+            self.batches.put(None)
+        for worker_thread in self.worker_threads:
+            worker_thread.join()
+        for process in self.local_processes:
+            process.join()
+
+
+def run_worker(host, port, nn=None):
+    """
+    Evaluates batches sent by a DistributedSwarmEvaluator until it sends a stop message. A batch that cannot be
+    evaluated is answered with the error, so the coordinator can give it to another worker
+    :param host: the address of the coordinator
+    :param port: the port of the coordinator
+    :param nn: the NeuralNetworkTools object to use. Created if not given
+    :return: nothing
+    """
+    if nn is None:
+        nn = neural_network_tools.NeuralNetworkTools()
+    fooling_generator = image_tools.FoolingPatternRenderer(neural_network_tools.IMAGE_DIM)
+
+    connection = socket.create_connection((host, port))
+    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    evaluator = None
+    setup_error = None
+    try:
+        while True:
+            message = receive_message(connection)
+            if message['type'] == 'stop':
+                return
+            elif message['type'] == 'setup':
+                try:
+                    evaluator = evaluation_tools.SwarmEvaluator(nn, list(decode_array(message['sources'])),
+                                                                list(decode_array(message['targets'])),
+                                                                decode_array(message['mask']), fooling_generator,
+                                                                message['dodging'],
+                                                                fitness_cache_size=message['fitness_cache_size'],
+                                                                racing_sources=message['racing_sources'])
+                except Exception:
+                    # The setup is not answered, so the error is returned for every batch instead
+                    setup_error = traceback.format_exc()
+            elif message['type'] == 'batch':
+                if setup_error is not None:
+                    send_message(connection, {'error': setup_error})
+                    continue
+                thresholds = message['thresholds']
+                if thresholds is not None:
+                    thresholds = np.array(thresholds)
+                try:
+                    (fitness, exact, statistics, evaluated, stage_timings) = \
+                        evaluation_tools.evaluate_with_statistics(evaluator, np.array(message['parameters']),
+                                                                  thresholds)
+                except Exception:
+                    send_message(connection, {'error': traceback.format_exc()})
+                    continue
+                send_message(connection, {'fitness': [float(value) for value in fitness],
+                                          'exact': [bool(value) for value in exact],
+                                          'statistics': [int(value) for value in statistics], 'evaluated': evaluated,
+                                          'stage_timings': stage_timings})
+    finally:
+        connection.close()
+
+
+def send_message(connection, message):
+    """
+    Sends a message as JSON, preceded by its length
+    :param connection: the socket
+    :param message: a dictionary
+    :return: nothing
+    """
+    data = json.dumps(message).encode('utf-8')
+    connection.sendall(struct.pack('>I', len(data)) + data)
+
+
+def receive_message(connection):
+    """
+    Receives a message sent by send_message
+    :param connection: the socket
+    :return: the dictionary
+    """
+    (length,) = struct.unpack('>I', receive_exactly(connection, 4))
+    return json.loads(receive_exactly(connection, length).decode('utf-8'))
+
+
+def receive_exactly(connection, length):
+    """
+    Receives a number of bytes
+    :param connection: the socket
+    :param length: the number of bytes
+    :return: the bytes
+    """
+    chunks = list()
+    while length > 0:
+        chunk = connection.recv(min(length, 1 << 20))
+        if not chunk:
+            raise EOFError('The connection was closed!')
+        chunks.append(chunk)
+        length -= len(chunk)
+    return b''.join(chunks)
+
+
+def encode_array(array):
+    """
+    Converts a numpy array to a dictionary that can be sent as JSON
+    :param array: the array
+    :return: the dictionary
+    """
+    array = np.ascontiguousarray(array)
+    return {'shape': list(array.shape), 'dtype': array.dtype.str,
+            'data': base64.b64encode(array.tobytes()).decode('ascii')}
+
+
+def decode_array(encoded_array):
+    """
+    Converts a dictionary created by encode_array back to a numpy array
+    :param encoded_array: the dictionary
+    :return: the array
+    """
+    data = base64.b64decode(encoded_array['data'].encode('ascii'))
+    return np.frombuffer(data, dtype=np.dtype(encoded_array['dtype'])).reshape(encoded_array['shape'])
@@ -0,0 +1,126 @@
+import collections
+import fcntl
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+class EmbeddingCache:
+    def __init__(self, path, model_path):
+        """
+        A persistent store for the representations of images that are used without a fooling pattern.
+        The representations are kept in path.npy (memory-mapped), the image hashes in path.json
+        :param path: the path of the cache files, without extension
+        :param model_path: the path of the network model. The cache is discarded if it was created by another model
+        """
+        self.matrix_path = path + '.npy'
+        self.index_path = path + '.json'
+        self.model_path = model_path
+
+        self.keys = dict()
+        self.embeddings = None
+        self.pending = collections.OrderedDict()
+        self.load()
+
+    def load(self):
+        """
+        Reads the representations on disk. They replace the ones read before, the pending ones are kept
+        :return: nothing
+        """
+        self.keys = dict()
+        self.embeddings = None
+        if os.path.exists(self.index_path) and os.path.exists(self.matrix_path):
+            with open(self.index_path) as index_file:
+                index = json.load(index_file)
+            if index['model'] == self.model_path:
+                # Rows without a key are left over from an interrupted save and are ignored. The matrix is replaced
+                # before the index, so it has at least as many rows as there are keys
+                self.embeddings = np.load(self.matrix_path, mmap_mode='r')[0:len(index['keys'])]
+                self.keys = dict((key, row) for row, key in enumerate(index['keys']))
+
+    def get(self, img):
+        """
+        Looks up the representation of an image
+        :param img: the image
+        :return: the representation or None if the image has not been seen before
+        """
+        key = image_key(img)
+        if key in self.keys:
+            return self.embeddings[self.keys[key]]
+
+        return self.pending.get(key)
+
+    def put(self, img, embedding):
+        """
+        Adds the representation of an image. It is written to disk by the next call to save()
+        :param img: the image
+        :param embedding: its representation
+        :return: nothing
+        """
+        key = image_key(img)
+        if key not in self.keys:
+            self.pending[key] = embedding
+
+    def save(self):
+        """
+        Writes all new representations to disk. Both files are replaced atomically. Processes that share the cache, like
+        the workers of ParallelSwarmEvaluator, save one after another, and the representations saved by the others in
+        the meantime are kept
+        :return: nothing
+        """
+        if len(self.pending) == 0:
+            return
+
+        with open(self.matrix_path + '.lock', 'a') as lock_file:
+            # The lock is released when the file is closed
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            self.load()
+            pending = [(key, embedding) for key, embedding in self.pending.items() if key not in self.keys]
+            if len(pending) > 0:
+                self.write(pending)
+        self.pending = collections.OrderedDict()
+
+    def write(self, pending):
+        """
+        Appends representations to the files on disk. Must only be called by save()
+        :param pending: list of tuples of an image key and its representation
+        :return: nothing
+        """
+        new_embeddings = np.array([embedding for _, embedding in pending])
+        if self.embeddings is None:
+            embeddings = new_embeddings
+        else:
+            embeddings = np.concatenate((self.embeddings, new_embeddings))
+        keys = [None] * len(self.keys)
+        for key, row in self.keys.items():
+            keys[row] = key
+        keys.extend(key for key, _ in pending)
+
+        # np.save appends .npy to names without it, so the temporary file has to end in .npy as well. The process id
+        # keeps the temporary files of processes apart
+        temporary_matrix_path = self.matrix_path + '.' + str(os.getpid()) + '.tmp.npy'
+        np.save(temporary_matrix_path, embeddings)
+        os.rename(temporary_matrix_path, self.matrix_path)
+
+        temporary_index_path = self.index_path + '.' + str(os.getpid()) + '.tmp'
+        with open(temporary_index_path, 'w') as index_file:
+            json.dump({'model': self.model_path, 'keys': keys}, index_file)
+        os.rename(temporary_index_path, self.index_path)
+
+        self.embeddings = np.load(self.matrix_path, mmap_mode='r')
+        self.keys = dict((key, row) for row, key in enumerate(keys))
+
+
+def image_key(img):
+    """
+    Calculates a hash of the contents of an image
+    :param img: the image
+    :return: a hex string that identifies the image
+    """
+    img = np.ascontiguousarray(img)
+    content_hash = hashlib.sha1(str(img.shape).encode('ascii'))
+    content_hash.update(str(img.dtype).encode('ascii'))
+    content_hash.update(img.tobytes())
+    return content_hash.hexdigest()
@@ -0,0 +1,467 @@
+import collections
+import hashlib
+import multiprocessing
+
+import numpy as np
+
+import image_tools
+import neural_network_tools
+import profiling_tools
+
+
+FITNESS_CACHE_SIZE = 10000
+
+# The representations of openface have unit length, so the likeness of two images is at most 4
+MAX_SQUARED_DISTANCE = 4.0
+
+
+class FitnessCache:
+    def __init__(self, size):
+        """
+        A bounded cache for the fitness of fooling patterns. The least recently used entry is dropped when it is full
+        :param size: the maximum number of entries
+        """
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Looks up the fitness of a pattern and counts the hit or miss
+        :param key: the key of the pattern (from pattern_key)
+        :return: the fitness or None if it is not cached
+        """
+        if key not in self.entries:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        value = self.entries.pop(key)
+        self.entries[key] = value
+        return value
+
+    def put(self, key, value):
+        """
+        Adds the fitness of a pattern
+        :param key: the key of the pattern (from pattern_key)
+        :param value: its fitness
+        :return: nothing
+        """
+        self.entries[key] = value
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+def pattern_key(fooling_pattern):
+    """
+    Calculates a hash of a rendered fooling pattern
+    :param fooling_pattern: the fooling pattern
+    :return: a bytes object that identifies the pattern
+    """
+    return hashlib.sha1(np.ascontiguousarray(fooling_pattern)).digest()
+
+
+class SwarmEvaluator:
+    def __init__(self, nn, sources, targets, mask, fooling_generator, dodging, target_embeddings=None, progress=None,
+                 fitness_cache_size=FITNESS_CACHE_SIZE, timer=None, racing_sources=0):
+        """
+        Objective function for swarm_tools.pso. Evaluates all particles of the swarm in the current process
+        :param nn: the NeuralNetworkTools object to use
+        :param sources: Source images (they get masked)
+        :param targets: Target images. For dodging, these are the unmasked source images
+        :param mask: The mask
+        :param fooling_generator: the function that creates a fooling pattern from a particle's parameters
+        :param dodging: if True, the likeness is maximized instead of minimized
+        :param target_embeddings: Precalculated representations of the targets. Calculated here if not given
+        :param progress: function that is called with the number of evaluated particles after every evaluation
+        :param fitness_cache_size: the number of patterns whose fitness is remembered. Particles whose pattern is
+        already known skip blending and the network. 0 disables the cache
+        :param timer: the profiling_tools.StageTimer that records the time spent in each stage. Created if not given
+        :param racing_sources: if not 0 and thresholds are passed, particles are first evaluated on this many sources.
+        The number of sources is doubled in every round, and particles that can no longer get below their threshold
+        drop out (see evaluate_patterns_racing)
+        """
+        self.nn = nn
+        self.sources = sources
+        self.targets = targets
+        self.mask = mask
+        self.fooling_generator = fooling_generator
+        self.dodging = dodging
+        self.progress = progress
+        self.racing_sources = racing_sources
+
+        self.timer = timer
+        if timer is None:
+            self.timer = profiling_tools.StageTimer()
+        self.evaluated = 0
+        self.exact = None
+        self.forwards = 0
+        self.skipped_forwards = 0
+
+        if target_embeddings is None:
+            target_embeddings = nn.embed_images(targets, cached=True)
+        self.target_embeddings = target_embeddings
+
+        # The sources and the mask never change, so their part of the blending is only calculated once
+        self.blend_kernel = image_tools.BlendKernel(sources, mask)
+        self.fooling_patterns = None
+
+        self.fitness_cache = None
+        if fitness_cache_size > 0:
+            self.fitness_cache = FitnessCache(fitness_cache_size)
+
+    def __call__(self, swarm_parameters, thresholds=None):
+        """
+        Returns the average likeness of the masked sources to the targets for every particle
+        :param swarm_parameters: matrix containing the generator parameters of one particle per row
+        :param thresholds: the fitness every particle has to get below, e.g. the fitness of its best position. Only
+        used for racing. Particles that cannot get below their threshold get a fitness that is not below it either.
+        Afterwards, the attribute exact is False for them
+        :return: Average likeness of every particle (-1 * average likeness for dodging)
+        """
+        # Reuse the buffer for the patterns as long as the swarm size stays the same
+        if self.fooling_patterns is None or len(self.fooling_patterns) != len(swarm_parameters):
+            self.fooling_patterns = np.zeros((len(swarm_parameters),) + self.blend_kernel.image_shape, dtype=np.uint8)
+
+        with self.timer.measure('render'):
+            if hasattr(self.fooling_generator, 'render_many'):
+                # Only the rows covered by the mask are rendered, the others are never used
+                self.fooling_generator.render_many(swarm_parameters, out=self.fooling_patterns,
+                                                   rows=self.blend_kernel.rows)
+            else:
+                for i in range(0, len(swarm_parameters)):
+                    self.fooling_patterns[i] = self.fooling_generator(neural_network_tools.IMAGE_DIM,
+                                                                      swarm_parameters[i])
+
+        if thresholds is None or self.racing_sources == 0:
+            thresholds = np.inf * np.ones(len(swarm_parameters))
+        thresholds = np.array(thresholds, dtype=float)
+
+        self.evaluated = 0
+        if self.fitness_cache is None:
+            (fitness, self.exact) = self.evaluate_patterns(self.fooling_patterns, thresholds)
+        else:
+            (fitness, self.exact) = self.evaluate_patterns_cached(self.fooling_patterns, thresholds)
+        self.timer.record(fitness, self.evaluated)
+
+        if self.progress is not None:
+            self.progress(len(swarm_parameters))
+        return fitness
+
+    def compare(self, fooling_patterns, first_source, last_source):
+        """
+        Blends the fooling patterns onto some of the sources and compares them to all targets
+        :param fooling_patterns: array containing the fooling patterns
+        :param first_source: index of the first source to use
+        :param last_source: index after the last source to use
+        :return: array of shape (patterns, targets, sources) containing the likenesses
+        """
+        number_of_sources = last_source - first_source
+        self.forwards += len(fooling_patterns) * number_of_sources
+
+        with self.timer.measure('blend'):
+            blended_images = self.blend_kernel.blend_many(fooling_patterns, first_background=first_source,
+                                                          last_background=last_source)
+
+        with self.timer.measure('forward'):
+            source_embeddings = self.nn.forward_batch(blended_images)
+
+        with self.timer.measure('distance'):
+            source_embeddings = source_embeddings.reshape((len(fooling_patterns), number_of_sources, -1))
+            results = neural_network_tools.squared_distances(self.target_embeddings, source_embeddings)
+        return results
+
+    def evaluate_patterns(self, fooling_patterns, thresholds):
+        """
+        Blends the fooling patterns onto the sources and compares them to the targets
+        :param fooling_patterns: array containing the fooling patterns
+        :param thresholds: the fitness every pattern has to get below. Only used for racing
+        :return: a tuple of the average likeness of every pattern (-1 * average likeness for dodging) and a boolean
+        array that is False for patterns that dropped out of the race (their fitness is only a bound)
+        """
+        self.evaluated += len(fooling_patterns)
+
+        if 0 < self.racing_sources < len(self.sources):
+            return self.evaluate_patterns_racing(fooling_patterns, thresholds)
+
+        results = self.compare(fooling_patterns, 0, len(self.sources))
+        with self.timer.measure('distance'):
+            fitness = np.mean(results, axis=(1, 2))
+            if self.dodging:
+                fitness = -1 * fitness
+        return fitness, np.ones(len(fooling_patterns), dtype=bool)
+
+    def evaluate_patterns_racing(self, fooling_patterns, thresholds):
+        """
+        Evaluates the fooling patterns on a growing number of sources. After every round, patterns whose fitness
+        cannot get below their threshold any more drop out. Likenesses are never negative and at most
+        MAX_SQUARED_DISTANCE, which bounds the fitness from below. The fitness of patterns that stay in the race until
+        the end is exact
+        :param fooling_patterns: array containing the fooling patterns
+        :param thresholds: the fitness every pattern has to get below
+        :return: a tuple of the average likeness of every pattern (-1 * average likeness for dodging) and a boolean
+        array that is False for patterns that dropped out of the race (their fitness is only a bound)
+        """
+        number_of_sources = len(self.sources)
+        number_of_pairs = len(self.target_embeddings) * number_of_sources
+        results = np.zeros((len(fooling_patterns), len(self.target_embeddings), number_of_sources))
+        fitness = np.zeros(len(fooling_patterns))
+        exact = np.zeros(len(fooling_patterns), dtype=bool)
+        active = np.arange(len(fooling_patterns))
+
+        first_source = 0
+        last_source = self.racing_sources
+        while True:
+            results[active, :, first_source:last_source] = self.compare(fooling_patterns[active], first_source,
+                                                                        last_source)
+            if last_source == number_of_sources:
+                break
+
+            with self.timer.measure('distance'):
+                partial_sums = np.sum(results[active, :, 0:last_source], axis=(1, 2))
+                if self.dodging:
+                    missing_pairs = len(self.target_embeddings) * (number_of_sources - last_source)
+                    bounds = -1 * (partial_sums + missing_pairs * MAX_SQUARED_DISTANCE) / number_of_pairs
+                else:
+                    bounds = partial_sums / number_of_pairs
+
+                dropped = bounds >= thresholds[active]
+                fitness[active[dropped]] = bounds[dropped]
+                self.skipped_forwards += np.count_nonzero(dropped) * (number_of_sources - last_source)
+                active = active[np.logical_not(dropped)]
+
+            if len(active) == 0:
+                break
+            first_source = last_source
+            last_source = min(number_of_sources, 2 * last_source)
+
+        with self.timer.measure('distance'):
+            exact[active] = True
+            fitness[active] = np.mean(results[active], axis=(1, 2))
+            if self.dodging:
+                fitness[active] = -1 * fitness[active]
+        return fitness, exact
+
+    def evaluate_patterns_cached(self, fooling_patterns, thresholds):
+        """
+        Like evaluate_patterns, but only patterns that are not in the fitness cache are evaluated. Patterns that occur
+        more than once are only evaluated once
+        :param fooling_patterns: array containing the fooling patterns
+        :param thresholds: the fitness every pattern has to get below. Only used for racing
+        :return: a tuple of the average likeness of every pattern (-1 * average likeness for dodging) and a boolean
+        array that is False for patterns that dropped out of the race
+        """
+        # The fitness only depends on the part of the pattern inside the mask's bounding box
+        keys = [pattern_key(fooling_pattern[self.blend_kernel.region]) for fooling_pattern in fooling_patterns]
+        fitness = np.zeros(len(fooling_patterns))
+        exact = np.ones(len(fooling_patterns), dtype=bool)
+
+        known = dict()
+        known_exact = dict()
+        missing = collections.OrderedDict()
+        for i, key in enumerate(keys):
+            if key in missing:
+                # A pattern that occurs more than once is raced against the highest of its thresholds. If it drops out,
+                # its bound is not below any of them, otherwise its fitness is exact for all of them
+                thresholds[missing[key]] = max(thresholds[missing[key]], thresholds[i])
+            if key in known:
+                continue
+            known[key] = self.fitness_cache.get(key)
+            if known[key] is None:
+                missing[key] = i
+
+        if len(missing) > 0:
+            indices = list(missing.values())
+            (values, values_exact) = self.evaluate_patterns(fooling_patterns[indices], thresholds[indices])
+            for i, value, value_exact in zip(indices, values, values_exact):
+                # The fitness of a pattern that dropped out of the race is only a bound and must not be cached
+                if value_exact:
+                    self.fitness_cache.put(keys[i], value)
+                known[keys[i]] = value
+                known_exact[keys[i]] = value_exact
+
+        for i, key in enumerate(keys):
+            fitness[i] = known[key]
+            exact[i] = known_exact.get(key, True)
+
+        # Patterns that occur more than once in the swarm count as hits after their first occurrence
+        self.fitness_cache.hits += len(keys) - len(known)
+        return fitness, exact
+
+    def cache_statistics(self):
+        """
+        Returns how many patterns were found in the fitness cache
+        :return: a tuple of hits and misses
+        """
+        if self.fitness_cache is None:
+            return 0, 0
+        return self.fitness_cache.hits, self.fitness_cache.misses
+
+    def racing_statistics(self):
+        """
+        Returns how many images were passed through the network, and how many were skipped by racing
+        :return: a tuple of forwards and skipped forwards
+        """
+        return self.forwards, self.skipped_forwards
+
+
+class ParallelSwarmEvaluator:
+    def __init__(self, workers, sources, targets, mask, fooling_generator, dodging, progress=None,
+                 fitness_cache_size=FITNESS_CACHE_SIZE, timer=None, racing_sources=0):
+        """
+        Objective function for swarm_tools.pso. Spreads the particles of the swarm over a pool of worker processes.
+        Every worker creates its own NeuralNetworkTools once and keeps it until close() is called. The images are
+        passed to the workers once through shared memory.
+        Every particle is evaluated exactly as by SwarmEvaluator, so the results are the same for a fixed seed
+        :param workers: the number of worker processes
+        :param sources: Source images (they get masked)
+        :param targets: Target images. For dodging, these are the unmasked source images
+        :param mask: The mask
+        :param fooling_generator: the function that creates a fooling pattern from a particle's parameters. Must be
+        picklable, like a module-level function or a FoolingPatternRenderer
+        :param dodging: if True, the likeness is maximized instead of minimized
+        :param progress: function that is called with the number of evaluated particles whenever a worker finishes
+        :param fitness_cache_size: the size of the fitness cache of every worker. 0 disables the cache
+        :param timer: the profiling_tools.StageTimer that receives the time the workers spent in each stage. Created
+        if not given
+        :param racing_sources: the number of sources particles are first evaluated on (see SwarmEvaluator)
+        """
+        self.workers = workers
+        self.progress = progress
+
+        self.timer = timer
+        if timer is None:
+            self.timer = profiling_tools.StageTimer()
+        self.fitness_cache_hits = 0
+        self.fitness_cache_misses = 0
+        self.forwards = 0
+        self.skipped_forwards = 0
+        self.exact = None
+
+        shared_images = [share_array(np.array(sources)), share_array(np.array(targets)), share_array(mask)]
+        self.pool = multiprocessing.Pool(workers, initializer=_init_worker,
+                                         initargs=(shared_images, fooling_generator, dodging, fitness_cache_size,
+                                                   racing_sources))
+
+    def __call__(self, swarm_parameters, thresholds=None):
+        """
+        Returns the average likeness of the masked sources to the targets for every particle
+        :param swarm_parameters: matrix containing the generator parameters of one particle per row
+        :param thresholds: the fitness every particle has to get below. Only used for racing (see SwarmEvaluator)
+        :return: Average likeness of every particle (-1 * average likeness for dodging)
+        """
+        number_of_chunks = min(self.workers, len(swarm_parameters))
+        if thresholds is None:
+            chunks = [(chunk, None) for chunk in np.array_split(swarm_parameters, number_of_chunks)]
+        else:
+            chunks = list(zip(np.array_split(swarm_parameters, number_of_chunks),
+                              np.array_split(thresholds, number_of_chunks)))
+
+        results = list()
+        exact = list()
+        evaluated = 0
+        for chunk_result, chunk_exact, statistics, chunk_evaluated, stage_timings in self.pool.imap(_evaluate_chunk,
+                                                                                                  chunks):
+            results.append(chunk_result)
+            exact.append(chunk_exact)
+            self.fitness_cache_hits += statistics[0]
+            self.fitness_cache_misses += statistics[1]
+            self.forwards += statistics[2]
+            self.skipped_forwards += statistics[3]
+            evaluated += chunk_evaluated
+            for stage, (seconds, calls) in stage_timings.items():
+                self.timer.add(stage, seconds, calls)
+            if self.progress is not None:
+                self.progress(len(chunk_result))
+
+        fitness = np.concatenate(results)
+        self.exact = np.concatenate(exact)
+        self.timer.record(fitness, evaluated)
+        return fitness
+
+    def cache_statistics(self):
+        """
+        Returns how many patterns were found in the fitness caches of all workers
+        :return: a tuple of hits and misses
+        """
+        return self.fitness_cache_hits, self.fitness_cache_misses
+
+    def racing_statistics(self):
+        """
+        Returns how many images the workers passed through the network, and how many were skipped by racing
+        :return: a tuple of forwards and skipped forwards
+        """
+        return self.forwards, self.skipped_forwards
+
+    def close(self):
+        """
+        Shuts down the worker processes
+        :return: nothing
+        """
+        self.pool.close()
+        self.pool.join()
+
+
+def share_array(array):
+    """
+    Copies an array into shared memory that can be passed to worker processes
+    :param array: a numpy array
+    :return: a tuple of the shared buffer, the shape and the dtype. Use shared_array_view to access it
+    """
+    array = np.ascontiguousarray(array)
+    shared_buffer = multiprocessing.RawArray('B', max(array.nbytes, 1))
+    shared_array_view((shared_buffer, array.shape, array.dtype.str))[...] = array
+    return shared_buffer, array.shape, array.dtype.str
+
+
+def shared_array_view(shared_array):
+    """
+    Creates a numpy array on top of an array created by share_array, without copying it
+    :param shared_array: the tuple returned by share_array
+    :return: the numpy array
+    """
+    shared_buffer, shape, dtype = shared_array
+    count = int(np.prod(shape))
+    return np.frombuffer(shared_buffer, dtype=np.dtype(dtype), count=count).reshape(shape)
+
+
+def evaluate_with_statistics(evaluator, swarm_parameters, thresholds=None):
+    """
+    Calls a SwarmEvaluator and collects what happened during the call, so it can be added up in another process
+    :param evaluator: the SwarmEvaluator
+    :param swarm_parameters: matrix containing the generator parameters of one particle per row
+    :param thresholds: the fitness every particle has to get below (see SwarmEvaluator)
+    :return: a tuple of the fitness of every particle, whether it is exact (see SwarmEvaluator), the changes of the
+    cache and racing statistics (hits, misses, forwards, skipped forwards), the number of evaluated patterns and the
+    seconds and calls of every stage
+    """
+    statistics = evaluator.cache_statistics() + evaluator.racing_statistics()
+    timer = evaluator.timer
+    stage_timings = dict((stage, (timer.seconds[stage], timer.calls[stage])) for stage in profiling_tools.STAGES)
+
+    fitness = evaluator(swarm_parameters, thresholds)
+
+    new_statistics = evaluator.cache_statistics() + evaluator.racing_statistics()
+    statistics = [new - old for new, old in zip(new_statistics, statistics)]
+    for stage in profiling_tools.STAGES:
+        (seconds, calls) = stage_timings[stage]
+        stage_timings[stage] = (timer.seconds[stage] - seconds, timer.calls[stage] - calls)
+    return fitness, evaluator.exact, statistics, evaluator.evaluated, stage_timings
+
+
+# The evaluator of a worker process, created once by _init_worker
+_worker_evaluator = None
+
+
+def _init_worker(shared_images, fooling_generator, dodging, fitness_cache_size, racing_sources):
+    global _worker_evaluator
+    sources, targets, mask = [shared_array_view(shared_array) for shared_array in shared_images]
+    _worker_evaluator = SwarmEvaluator(neural_network_tools.NeuralNetworkTools(), list(sources), list(targets), mask,
+                                       fooling_generator, dodging, fitness_cache_size=fitness_cache_size,
+                                       racing_sources=racing_sources)
+
+
+def _evaluate_chunk(chunk):
+    (swarm_parameters, thresholds) = chunk
+    return evaluate_with_statistics(_worker_evaluator, swarm_parameters, thresholds)
@@ -0,0 +1,73 @@
+import multiprocessing.pool
+
+import image_tools
+import neural_network_tools
+
+EXPORT_THREADS = 4
+
+
+class ResultExporter:
+    def __init__(self, threads=EXPORT_THREADS, prefix='images/fooling'):
+        """
+        Saves result images in background threads, so the optimization and the final report do not wait for the PNG
+        encoding and the disk
+        :param threads: the number of threads that save images
+        :param prefix: the start of the path of the patterns saved by export_best, e.g. 'images/dodging' for dodging
+        """
+        self.prefix = prefix
+        self.pool = multiprocessing.pool.ThreadPool(threads)
+        self.pending = list()
+        self.fooling_generator = image_tools.FoolingPatternRenderer(neural_network_tools.IMAGE_DIM)
+        self.exported_fitness = None
+
+    def save(self, image, filename):
+        """
+        Saves an image in the background. The image must not be changed afterwards
+        :param image: the image
+        :param filename: the complete path and filename
+        :return: nothing
+        """
+        self.pending.append(self.pool.apply_async(image_tools.save_image, (image, filename)))
+
+    def blend_and_save(self, background, foreground, mask, filename):
+        """
+        Blends a foreground onto a background (see image_tools.blend) and saves the result in the background
+        :param background: the background image
+        :param foreground: the foreground image
+        :param mask: the mask
+        :param filename: the complete path and filename
+        :return: nothing
+        """
+        self.pending.append(self.pool.apply_async(_blend_and_save, (background, foreground, mask, filename)))
+
+    def export_best(self, iteration, best_position, best_fitness):
+        """
+        Saves the fooling pattern of the swarm's best position in the background, unless it was already saved.
+        Can be called from the callback of swarm_tools.pso
+        :param iteration: the number of the iteration that was just completed
+        :param best_position: the swarm's best position
+        :param best_fitness: the swarm's best fitness
+        :return: nothing
+        """
+        if best_fitness == self.exported_fitness:
+            return
+        self.exported_fitness = best_fitness
+
+        fooling_pattern = self.fooling_generator(neural_network_tools.IMAGE_DIM, best_position)
+        self.save(fooling_pattern, self.prefix + '_iteration' + str(iteration) + '_' + str(best_fitness) +
+                  '_fooling_pattern.png')
+
+    def close(self):
+        """
+        Waits until all images are saved. Errors that occurred while saving are raised here
+        :return: nothing
+        """
+        self.pool.close()
+        self.pool.join()
+        for result in self.pending:
+            result.get()
+        self.pending = list()
+
+
+def _blend_and_save(background, foreground, mask, filename):
+    image_tools.save_image(image_tools.blend(background, foreground, mask), filename)
@@ -53,7 +53,7 @@ def blend(background, foreground, mask):
 
     # Create the array for the new img
     blended_image = np.zeros(background.shape, dtype=np.uint8)
-    mask.shape = background.shape[0], background.shape[1]
+    mask = mask.reshape((background.shape[0], background.shape[1]))
 
     for dimension in range(0, background.shape[2]):
         blended_image[..., dimension] = \
@@ -63,6 +63,111 @@ def blend(background, foreground, mask):
     return blended_image
 
 
+class BlendKernel:
+    def __init__(self, backgrounds, mask):
+        """
+        Blends batches of foreground images onto a fixed set of background images according to a mask, with the same
+        result as blend(). The mask weights and the weighted backgrounds are only calculated once.
+        Outside the bounding box of the non-zero mask values, the result is the background. Only the bounding box is
+        blended, the rest of the images is copied from the backgrounds
+        :param backgrounds: array containing N background images (N x height x width x layers)
+        :param mask: sciPy array containing the mask. must be 1d
+        """
+        backgrounds = np.asarray(backgrounds)
+        if backgrounds.shape[1] != mask.shape[0] or backgrounds.shape[2] != mask.shape[1]:
+            raise ValueError('Backgrounds and mask are not the same size!')
+
+        mask = mask.reshape((mask.shape[0], mask.shape[1], 1))
+        self.image_shape = backgrounds.shape[1:]
+        self.number_of_backgrounds = backgrounds.shape[0]
+        self.backgrounds = backgrounds
+
+        # The bounding box of the mask
+        (rows, columns) = np.nonzero(mask[..., 0])
+        if len(rows) == 0:
+            self.rows = (0, 0)
+            self.columns = (0, 0)
+        else:
+            self.rows = (int(rows.min()), int(rows.max()) + 1)
+            self.columns = (int(columns.min()), int(columns.max()) + 1)
+        self.region = (slice(self.rows[0], self.rows[1]), slice(self.columns[0], self.columns[1]))
+
+        # Same operations as in blend(), so the results are identical. The calculation is done in the mask's float type
+        mask = mask[self.region]
+        self.alpha = np.divide(mask, 255.0)
+        self.weighted_backgrounds = np.multiply(np.divide((255 - mask), 255.0),
+                                                backgrounds[(slice(None),) + self.region])
+
+        self.weighted_foreground = np.zeros(self.alpha.shape[0:2] + self.image_shape[2:],
+                                            dtype=self.weighted_backgrounds.dtype)
+        self.blended = np.zeros(self.weighted_backgrounds.shape, dtype=self.weighted_backgrounds.dtype)
+
+        # The images returned by blend_many, and the background that is outside the bounding box of each of them
+        self.images = None
+        self.image_backgrounds = None
+
+    def blend_many(self, foregrounds, out=None, first_background=0, last_background=None):
+        """
+        Blends every foreground onto every background
+        :param foregrounds: array containing P foreground images (P x height x width x layers). Only the bounding box
+        of the mask is used
+        :param out: uint8 array of shape (P * N x height x width x layers) to write to. If not given, an array that is
+        kept between calls is used, so the parts outside the bounding box only have to be copied when they change.
+        It is overwritten by the next call
+        :param first_background: index of the first background to blend onto
+        :param last_background: index after the last background to blend onto. All backgrounds if not given
+        :return: the overlaid images. Image p * N + n is foreground p overlaid on background n (N is the number of
+        backgrounds used)
+        """
+        if foregrounds.shape[1:] != self.image_shape:
+            raise ValueError('Foregrounds and backgrounds are not the same size or dimension!')
+
+        if last_background is None:
+            last_background = self.number_of_backgrounds
+        number_of_backgrounds = last_background - first_background
+        weighted_backgrounds = self.weighted_backgrounds[first_background:last_background]
+        blended = self.blended[0:number_of_backgrounds]
+
+        number_of_images = foregrounds.shape[0] * number_of_backgrounds
+        if out is None:
+            out = self.reuse_images(foregrounds.shape[0], first_background, last_background)
+        else:
+            if out.shape != (number_of_images,) + self.image_shape:
+                raise ValueError('The output array has the wrong size!')
+            out.reshape((foregrounds.shape[0], number_of_backgrounds) + self.image_shape)[...] = \
+                self.backgrounds[first_background:last_background]
+
+        out_region = out[(slice(None),) + self.region]
+        for i in range(0, foregrounds.shape[0]):
+            np.multiply(self.alpha, foregrounds[i][self.region], out=self.weighted_foreground)
+            np.add(self.weighted_foreground, weighted_backgrounds, out=blended)
+            np.copyto(out_region[i * number_of_backgrounds:(i + 1) * number_of_backgrounds], blended,
+                      casting='unsafe')
+
+        return out
+
+    def reuse_images(self, number_of_foregrounds, first_background, last_background):
+        """
+        Prepares the array kept between calls of blend_many. Outside the bounding box, every image has to contain its
+        background. It is only copied there if the image contained another one before
+        :param number_of_foregrounds: the number of foregrounds
+        :param first_background: index of the first background
+        :param last_background: index after the last background
+        :return: the images
+        """
+        number_of_images = number_of_foregrounds * (last_background - first_background)
+        if self.images is None or len(self.images) < number_of_images:
+            self.images = np.zeros((number_of_images,) + self.image_shape, dtype=np.uint8)
+            self.image_backgrounds = -1 * np.ones(number_of_images, dtype=int)
+
+        wanted_backgrounds = np.tile(np.arange(first_background, last_background), number_of_foregrounds)
+        changed = np.nonzero(self.image_backgrounds[0:number_of_images] != wanted_backgrounds)[0]
+        self.images[changed] = self.backgrounds[wanted_backgrounds[changed]]
+        self.image_backgrounds[changed] = wanted_backgrounds[changed]
+
+        return self.images[0:number_of_images]
+
+
 NUMBER_OF_LINES = 10
 
 
@@ -108,6 +213,96 @@ def create_fooling_pattern(size, param):
     return result_image
 
 
+class FoolingPatternRenderer:
+    def __init__(self, size):
+        """
+        Generates fooling patterns like create_fooling_pattern, with pixel-identical results. The OpenCV version is only
+        checked once and the intermediate images are reused between calls
+        :param size: the size in pixels of the fooling patterns
+        """
+        self.size = size
+
+        if is_cv2():
+            self.filled = cv2.cv.CV_FILLED
+            self.line_type = cv2.CV_AA
+        else:
+            self.filled = -1
+            self.line_type = cv2.LINE_AA
+
+        self.half_pattern = np.zeros((size, size // 2, 3), dtype=np.uint8)
+        self.blurred_pattern = np.zeros((size, size // 2, 3), dtype=np.uint8)
+
+    def __call__(self, size, param):
+        """
+        Drop-in replacement for create_fooling_pattern
+        :param size: the size in pixels of the fooling pattern. Must be the size the renderer was created with
+        :param param: an array containing the values for all the parameters
+        :return: the fooling pattern (not masked yet)
+        """
+        assert size == self.size
+
+        result_image = np.zeros((size, size, 3), dtype=np.uint8)
+        self.render(param, result_image)
+        return result_image
+
+    def render(self, param, out, rows=None):
+        """
+        Generates a fooling pattern into an existing array
+        :param param: an array containing the values for all the parameters
+        :param out: the uint8 array of shape (size x size x 3) that receives the fooling pattern
+        :param rows: a tuple of the first row and the row after the last one that are needed, e.g. the rows of the
+        mask (see BlendKernel). Only these rows of out are written. All rows if not given
+        :return: nothing
+        """
+        fooling_pattern = self.half_pattern
+
+        # param0,1,2 is the background color
+        cv2.rectangle(fooling_pattern, (0, 0), (self.size, self.size), color=(param[0], param[1], param[2]),
+                      thickness=self.filled)
+
+        # Create NUMBER_OF_LINES lines
+        for i in range(0, NUMBER_OF_LINES):
+            pt1 = (int(round(param[8 * i + 0 + 3])), int(round(param[8 * i + 1 + 3])))
+            pt2 = (int(round(param[8 * i + 2 + 3])), int(round(param[8 * i + 3 + 3])))
+            color = (param[8 * i + 4 + 3], param[8 * i + 5 + 3], param[8 * i + 6 + 3])
+            cv2.line(fooling_pattern, pt1, pt2, color, thickness=int(round(param[8 * i + 7 + 3])),
+                     lineType=self.line_type, shift=0)
+
+        # Blur it
+        blur_radius = int(round(param[len(param) - 1]))
+        blur_value = blur_radius * 2 + 1  # Must be an odd integer
+        if rows is None:
+            rows = (0, self.size)
+        if rows[1] <= rows[0]:
+            return
+
+        # A blurred row only depends on the rows within the blur radius, so only those are blurred
+        blurred_rows = slice(max(rows[0] - blur_radius, 0), min(rows[1] + blur_radius, self.size))
+        cv2.blur(fooling_pattern[blurred_rows], (blur_value, blur_value), dst=self.blurred_pattern[blurred_rows])
+
+        # Now mirror it to the other side of the resulting image
+        half_size = self.size // 2
+        out[rows[0]:rows[1], 0:half_size, ...] = self.blurred_pattern[rows[0]:rows[1]]
+        out[rows[0]:rows[1], half_size:self.size, ...] = self.blurred_pattern[rows[0]:rows[1], ::-1, ...]
+
+    def render_many(self, params_matrix, out=None, rows=None):
+        """
+        Generates the fooling patterns of a whole swarm
+        :param params_matrix: matrix containing the parameters of one fooling pattern per row
+        :param out: uint8 array of shape (rows x size x size x 3) that receives the fooling patterns. Allocated if not
+        given
+        :param rows: the rows of the patterns that are needed (see render). All rows if not given
+        :return: the fooling patterns
+        """
+        if out is None:
+            out = np.zeros((len(params_matrix), self.size, self.size, 3), dtype=np.uint8)
+
+        for i in range(0, len(params_matrix)):
+            self.render(params_matrix[i], out[i], rows)
+
+        return out
+
+
 def create_fooling_pattern_bounds():
     """
     Returns a 2-Array tuple containing the upper and lower bounds for create_fooling_pattern
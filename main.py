@@ -2,48 +2,16 @@ import argparse
 import numpy as np
 import time
 
-from pyswarm import pso
-
+import archive_tools
+import dataset_tools
+import distributed_tools
+import evaluation_tools
+import export_tools
 import image_tools
 import neural_network_tools
-
-
-def optimization_function_dodging(generator_parameters):
-    """
-    Optimization function. Returns the average likenss of the masked source to the source
-    :param generator_parameters:
-    :return: -1 * Avergae likeness
-    """
-    local_fooling_pattern = fooling_generator(neural_network_tools.IMAGE_DIM, generator_parameters)
-
-    results = nn.calculate_likenesses(source_images, source_images, mask, local_fooling_pattern)
-
-    global optimization_counter
-    optimization_counter += 1
-    run_time = time.time() - optimization_start
-    time_remaining = (run_time / optimization_counter) * (number_of_particles * (number_of_iterations + 1)) - run_time
-    print('Optimization run {:5d} of {}, optimizing for {:8.1f} seconds, estimated time remaing {:8.1f} seconds'.format(
-        optimization_counter, (number_of_iterations + 1) * number_of_particles, run_time, time_remaining))
-    return -1 * np.mean(results)
-
-
-def optimization_function_fooling(generator_parameters):
-    """
-    Optimization function. Returns the average likenss of the masked source to the target
-    :param generator_parameters:
-    :return: Avergae likeness (Standard deviation is ignored)
-    """
-    local_fooling_pattern = fooling_generator(neural_network_tools.IMAGE_DIM, generator_parameters)
-
-    results = nn.calculate_likenesses(source_images, target_images, mask, local_fooling_pattern)
-
-    global optimization_counter
-    optimization_counter += 1
-    run_time = time.time() - optimization_start
-    time_remaining = (run_time / optimization_counter) * (number_of_particles * (number_of_iterations + 1)) - run_time
-    print('Optimization run {:5d} of {}, optimizing for {:8.1f} seconds, estimated time remaing {:8.1f} seconds'.format(
-        optimization_counter, (number_of_iterations + 1) * number_of_particles, run_time, time_remaining))
-    return np.mean(results)
+import profiling_tools
+import surrogate_tools
+import swarm_tools
 
 
 # Main program start: Argument paring
@@ -55,86 +23,232 @@ parser.add_argument('--particles', type=int,
                     default=100)
 parser.add_argument('--iterations', type=int,
                     help="Number of iterations of the optimization.\n Linear impact on computing time.", default=10)
-parser.add_argument('--images', type=int, help="Number of images to compare.\nQUADRATIC impact on computing time.",
+parser.add_argument('--images', type=int, help="Number of images to compare.\nLinear impact on computing time.",
                     default=1)
 parser.add_argument('--dodging', action='store_true')
+parser.add_argument('--sources', help="Dataset created by build_dataset.py to take the source images from, instead of "
+                                      "the images folder.", default=None)
+parser.add_argument('--targets', help="Dataset created by build_dataset.py to take the target images from, instead of "
+                                      "the images folder.", default=None)
+parser.add_argument('--workers', type=int,
+                    help="Number of worker processes that evaluate the particles.\nEach one loads its own neural network.",
+                    default=1)
+parser.add_argument('--coordinator', type=int,
+                    help="Port that workers on other machines (worker.py) connect to. The particles are evaluated by "
+                         "the workers instead of this process.", default=None)
+parser.add_argument('--coordinator-host',
+                    help="Address the --coordinator port is opened on, e.g. 0.0.0.0 for all interfaces.\nWorkers are "
+                         "not authenticated, so only use addresses of trusted networks.",
+                    default=distributed_tools.COORDINATOR_HOST)
+parser.add_argument('--local-workers', type=int,
+                    help="Number of workers started on this machine with --coordinator.", default=0)
+parser.add_argument('--batch-size', type=int, help="Number of particles sent to a worker at once with --coordinator.",
+                    default=distributed_tools.DISTRIBUTED_BATCH_SIZE)
+parser.add_argument('--worker-timeout', type=float,
+                    help="Seconds to wait for a result from the workers with --coordinator before giving up.\n"
+                         "Default: wait until a worker connects.", default=None)
+parser.add_argument('--seed', type=int, help="Seed for the random start values of the particles.", default=None)
+parser.add_argument('--checkpoint', help="File the state of the optimization is saved to after every iteration.",
+                    default=None)
+parser.add_argument('--resume', help="Checkpoint file to continue an interrupted optimization from.\n"
+                                     "Use the same arguments as for the interrupted run.", default=None)
+parser.add_argument('--fitness-cache', type=int,
+                    help="Number of fooling patterns whose result is remembered, so identical patterns are only "
+                         "evaluated once.\n0 disables the cache.", default=evaluation_tools.FITNESS_CACHE_SIZE)
+parser.add_argument('--progress-interval', type=float,
+                    help="Seconds between progress reports within an iteration.\nProgress is always reported after "
+                         "every iteration.", default=10.0)
+parser.add_argument('--racing', type=int,
+                    help="Number of images every particle is first evaluated on. Particles that cannot improve on their "
+                         "best position any more are not evaluated on the remaining images.\n0 disables racing.",
+                    default=0)
+parser.add_argument('--surrogate', type=float,
+                    help="Fraction of the particles that is evaluated, chosen by a cheap model of the previous "
+                         "evaluations.\n0 evaluates every particle.", default=0)
+parser.add_argument('--surrogate-exploration', type=float,
+                    help="Fraction of the particles that is evaluated in addition because they are furthest from all "
+                         "particles evaluated so far.", default=0.1)
+parser.add_argument('--archive', help="Directory of an archive every evaluated particle is added to.", default=None)
+parser.add_argument('--warm-start', help="Archive to take the best particles of earlier runs with the same mask and mode "
+                                         "from. They are used as start values.", default=None)
+parser.add_argument('--warm-start-particles', type=int,
+                    help="Number of particles that start at positions from --warm-start.\nDefault: half of the "
+                         "particles.", default=None)
+parser.add_argument('--export-interval', type=int,
+                    help="Save the fooling pattern of the best position every this many iterations, if it changed."
+                         "\n0 only saves the final result.", default=0)
+parser.add_argument('--trace', help="JSONL file that receives the stage timings and results of every evaluated swarm.",
+                    default=None)
 args = parser.parse_args()
 
-# Read in arguments and paths and define optikmization settings
-source_paths = ['images/source2.png', 'images/source4.png', 'images/source5.png', 'images/source1.png',
-                'images/source3.png']
-target_paths = ['images/target1.png', 'images/target2.png', 'images/target5.png', 'images/target3.png',
-                'images/target4.png']
-mask_path = 'images/barMask.png'
-
-source_images = list()
-target_images = list()
-for i in range(0, args.images):
-    source_images.append(image_tools.load_image(source_paths[i], 3))
-    target_images.append(image_tools.load_image(target_paths[i], 3))
+# The datasets are memory-mapped, so only the images that are used are read
+source_images = dataset_tools.load_faces(args.images, args.sources, dataset_tools.SOURCE_PATHS)
+target_images = dataset_tools.load_faces(args.images, args.targets, dataset_tools.TARGET_PATHS)
 
-mask = image_tools.load_image(mask_path, 1)
+mask = image_tools.load_image(dataset_tools.MASK_PATH, 1)
 
 # Instantiate a reusable neural network object to increase performance
 nn = neural_network_tools.NeuralNetworkTools()
 
 ##### DEFINE ALTERNATE FOOLING PATTERN GENERATORS HERE #####
-fooling_generator = image_tools.create_fooling_pattern
+fooling_generator = image_tools.FoolingPatternRenderer(neural_network_tools.IMAGE_DIM)
 (lower_bounds, upper_bounds) = image_tools.create_fooling_pattern_bounds()
 ##### END FOOLING PATTERN GENERATOR DEFINITION #####
 
-optimization_counter = 0
-optimization_start = time.time()
-
-number_of_iterations = args.iterations
-number_of_particles = args.particles
-
-optimization_function = optimization_function_fooling
+comparison_images = target_images
 if args.dodging:
     print("Calculating mask for dodging.")
-    optimization_function = optimization_function_dodging
-
-print("Startup took {:.1f} seconds.".format(time.time() - start))
-xopt, fopt = pso(optimization_function, lower_bounds, upper_bounds, debug=False, maxiter=number_of_iterations,
-                 swarmsize=number_of_particles, minfunc=1e-3, phig=2.0, phip=2.0)
-
-empty_mask = np.multiply(0,
-                         np.ones((neural_network_tools.IMAGE_DIM, neural_network_tools.IMAGE_DIM, 1), dtype=np.uint8))
-empty_pattern = np.multiply(255, np.ones((neural_network_tools.IMAGE_DIM, neural_network_tools.IMAGE_DIM, 3),
-                                         dtype=np.uint8))
-fooling_pattern = fooling_generator(neural_network_tools.IMAGE_DIM, xopt)
-
-likenesses_source_source = nn.calculate_likenesses(target_images, target_images, empty_mask, empty_pattern)
-print("Likenesses between target and itself:\n" + str(likenesses_source_source))
-print("Mean: " + str(np.mean(likenesses_source_source)) + ", Standard deviation: " + str(
-    np.std(likenesses_source_source)) + "\n")
+    comparison_images = source_images
 
-if not args.dodging:
-    likenesses = nn.calculate_likenesses(source_images, target_images, empty_mask, empty_pattern)
-    print("Likenesses between target and source without fooling pattern:\n" + str(likenesses))
-    print("Mean: " + str(np.mean(likenesses)) + ", Standard deviation: " + str(np.std(likenesses)) + "\n")
+# The images we compare against never change, so they only run through the network once
+comparison_embeddings = nn.embed_images(comparison_images, cached=True)
 
-    likenesses_fooled_source_target = nn.calculate_likenesses(source_images, target_images, mask, fooling_pattern)
-    print("Likenesses between target and source with fooling pattern:\n" + str(likenesses_fooled_source_target))
-    print("Mean: " + str(np.mean(likenesses_fooled_source_target)) + ", Standard deviation: " + str(
-        np.std(likenesses_fooled_source_target)) + "\n")
+# Keep writing to the checkpoint we resume from unless another one is given
+checkpoint_path = args.checkpoint
+if checkpoint_path is None:
+    checkpoint_path = args.resume
 
-    for i in range(0, len(source_images)):
-        source_img = source_images.pop()
-        blended_image = image_tools.blend(source_img, fooling_pattern, mask)
-        image_tools.save_image(blended_image, 'images/fooling_' + str(fopt) + '_' + str(i) + '_result.png')
+resumed_evaluations = 0
+if args.resume is not None:
+    resumed_evaluations = swarm_tools.load_checkpoint(args.resume)['evaluations']
+    print("Resuming after {} evaluations.".format(resumed_evaluations))
 
-    image_tools.save_image(fooling_pattern, 'images/fooling' + str(fopt) + '_fooling_pattern.png')
+number_of_iterations = args.iterations
+number_of_particles = args.particles
 
+timer = profiling_tools.StageTimer(args.trace)
+progress = profiling_tools.ProgressReporter(number_of_particles * (number_of_iterations + 1),
+                                            interval=args.progress_interval, completed_evaluations=resumed_evaluations)
+
+if args.coordinator is not None:
+    optimization_function = distributed_tools.DistributedSwarmEvaluator(args.coordinator, source_images,
+                                                                        comparison_images, mask, args.dodging,
+                                                                        host=args.coordinator_host,
+                                                                        batch_size=args.batch_size,
+                                                                        local_workers=args.local_workers,
+                                                                        progress=progress.count,
+                                                                        fitness_cache_size=args.fitness_cache,
+                                                                        timer=timer, racing_sources=args.racing,
+                                                                        timeout=args.worker_timeout)
+elif args.workers > 1:
+    optimization_function = evaluation_tools.ParallelSwarmEvaluator(args.workers, source_images, comparison_images, mask,
+                                                                    fooling_generator, args.dodging,
+                                                                    progress=progress.count,
+                                                                    fitness_cache_size=args.fitness_cache, timer=timer,
+                                                                    racing_sources=args.racing)
 else:
-    likenesses_fooled_source_source = nn.calculate_likenesses(source_images, source_images, mask, fooling_pattern)
-    print("Likenesses between source and source with fooling pattern:\n" + str(likenesses_fooled_source_source))
-    print("Mean: " + str(np.mean(likenesses_fooled_source_source)) + ", Standard deviation: " + str(
-        np.std(likenesses_fooled_source_source)) + "\n")
-
-    for i in range(0, len(source_images)):
-        source_img = source_images.pop()
-        blended_image = image_tools.blend(source_img, fooling_pattern, mask)
-        image_tools.save_image(blended_image, 'images/dodging' + str(fopt) + '_' + str(i) + '_result.png')
-
-    image_tools.save_image(fooling_pattern, 'images/dodging' + str(fopt) + '_fooling_pattern.png')
+    optimization_function = evaluation_tools.SwarmEvaluator(nn, source_images, comparison_images, mask,
+                                                            fooling_generator, args.dodging,
+                                                            target_embeddings=comparison_embeddings,
+                                                            progress=progress.count,
+                                                            fitness_cache_size=args.fitness_cache, timer=timer,
+                                                            racing_sources=args.racing)
+
+objective_function = optimization_function
+if args.surrogate > 0:
+    screening_function = surrogate_tools.SurrogateScreeningEvaluator(optimization_function, lower_bounds, upper_bounds,
+                                                                     args.surrogate,
+                                                                     exploration=args.surrogate_exploration,
+                                                                     progress=progress.count)
+    objective_function = screening_function
+
+mask_key = archive_tools.data_key([mask])
+if args.archive is not None:
+    archive = archive_tools.EvaluationArchive(args.archive, len(lower_bounds))
+    objective_function = archive_tools.ArchivingEvaluator(objective_function, archive, args.dodging,
+                                                          archive_tools.data_key(source_images + comparison_images),
+                                                          mask_key)
+
+initial_positions = None
+if args.warm_start is not None and args.resume is None:
+    warm_start_particles = args.warm_start_particles
+    if warm_start_particles is None:
+        warm_start_particles = number_of_particles // 2
+    initial_positions = archive_tools.EvaluationArchive(args.warm_start, len(lower_bounds), writable=False).best(
+        warm_start_particles, args.dodging, mask_key)
+    print("Starting {} particles at positions from earlier runs.".format(len(initial_positions)))
+
+export_prefix = 'images/fooling'
+if args.dodging:
+    export_prefix = 'images/dodging'
+exporter = export_tools.ResultExporter(prefix=export_prefix)
+
+
+def iteration_callback(iteration, best_position, best_fitness):
+    progress.iteration(iteration, best_position, best_fitness)
+    if args.export_interval > 0 and iteration % args.export_interval == 0:
+        exporter.export_best(iteration, best_position, best_fitness)
+
+
+# Queued images are saved even if the optimization or the report fails
+try:
+    print("Startup took {:.1f} seconds.".format(time.time() - start))
+    progress.start = time.time()
+    xopt, fopt = swarm_tools.pso(objective_function, lower_bounds, upper_bounds, debug=False,
+                                 maxiter=number_of_iterations, swarmsize=number_of_particles, minfunc=1e-3, phig=2.0,
+                                 phip=2.0, random_state=np.random.RandomState(args.seed), checkpoint=checkpoint_path,
+                                 resume=args.resume, callback=iteration_callback, thresholds=args.racing > 0,
+                                 initial_positions=initial_positions,
+                                 evaluations=lambda: progress.completed_evaluations)
+
+    if args.coordinator is not None or args.workers > 1:
+        optimization_function.close()
+
+    timer.close()
+    print("Time spent in each stage of the evaluation:\n" + timer.summary())
+
+    if args.fitness_cache > 0:
+        (cache_hits, cache_misses) = optimization_function.cache_statistics()
+        print("Fitness cache: {} hits, {} misses.".format(cache_hits, cache_misses))
+
+    if args.racing > 0:
+        (forwards, skipped_forwards) = optimization_function.racing_statistics()
+        print("Racing: {} images passed through the network, {} skipped.".format(forwards, skipped_forwards))
+
+    if args.surrogate > 0:
+        (surrogate_evaluated, surrogate_skipped, surrogate_error) = screening_function.statistics()
+        print("Surrogate: {} particles evaluated, {} skipped ({} fewer images through the network), mean absolute "
+              "prediction error {}.".format(surrogate_evaluated, surrogate_skipped,
+                                            surrogate_skipped * len(source_images), surrogate_error))
+
+    fooling_pattern = fooling_generator(neural_network_tools.IMAGE_DIM, xopt)
+
+    # The result images are saved in the background while the report is calculated
+    if not args.dodging:
+        for i in range(0, len(source_images)):
+            exporter.blend_and_save(source_images[len(source_images) - 1 - i], fooling_pattern, mask,
+                                    'images/fooling_' + str(fopt) + '_' + str(i) + '_result.png')
+
+        exporter.save(fooling_pattern, 'images/fooling' + str(fopt) + '_fooling_pattern.png')
+
+    else:
+        for i in range(0, len(source_images)):
+            exporter.blend_and_save(source_images[len(source_images) - 1 - i], fooling_pattern, mask,
+                                    'images/dodging' + str(fopt) + '_' + str(i) + '_result.png')
+
+        exporter.save(fooling_pattern, 'images/dodging' + str(fopt) + '_fooling_pattern.png')
+
+    report = nn.calculate_report_likenesses(source_images, target_images, mask, fooling_pattern)
+
+    likenesses_source_source = report['target_target']
+    print("Likenesses between target and itself:\n" + str(likenesses_source_source))
+    print("Mean: " + str(np.mean(likenesses_source_source)) + ", Standard deviation: " + str(
+        np.std(likenesses_source_source)) + "\n")
+
+    if not args.dodging:
+        likenesses = report['source_target']
+        print("Likenesses between target and source without fooling pattern:\n" + str(likenesses))
+        print("Mean: " + str(np.mean(likenesses)) + ", Standard deviation: " + str(np.std(likenesses)) + "\n")
+
+        likenesses_fooled_source_target = report['fooled_target']
+        print("Likenesses between target and source with fooling pattern:\n" + str(likenesses_fooled_source_target))
+        print("Mean: " + str(np.mean(likenesses_fooled_source_target)) + ", Standard deviation: " + str(
+            np.std(likenesses_fooled_source_target)) + "\n")
+
+    else:
+        likenesses_fooled_source_source = report['fooled_source']
+        print("Likenesses between source and source with fooling pattern:\n" + str(likenesses_fooled_source_source))
+        print("Mean: " + str(np.mean(likenesses_fooled_source_source)) + ", Standard deviation: " + str(
+            np.std(likenesses_fooled_source_source)) + "\n")
+finally:
+    exporter.close()
@@ -18,25 +18,65 @@
 
 import numpy as np
 
-import openface
+try:
+    import openface
+except ImportError:
+    # Only needed for the real network, see NeuralNetworkTools
+    openface = None
 
+import embedding_cache
 import image_tools
 import tools
+import torch_backend
 
 IMAGE_DIM = 96
 DLIB_PATH_KEY = 'dlibFacePredictorPath'
 MODEL_PATH_KEY = 'networkModelPath'
+BACKEND_KEY = 'networkBackend'
+EMBEDDING_CACHE_PATH = 'images/embedding_cache'
+
+
+class FaceNotFoundError(Exception):
+    """
+    Raised by align_face if an image contains no face that can be aligned
+    """
+    pass
 
 
 class NeuralNetworkTools:
-    def __init__(self):
-        # Load the path to dlib from config
-        dlib_face_predictor_directory = tools.load_key_from_config(DLIB_PATH_KEY).encode('ascii', 'ignore')
-        self.align = openface.AlignDlib(dlib_face_predictor_directory)
+    def __init__(self, embedding_cache_path=EMBEDDING_CACHE_PATH, net=None):
+        """
+        Loads the face aligner and the face recognition DNN configured in config.json
+        :param embedding_cache_path: the path of the embedding cache (see embedding_cache.py). None disables it
+        :param net: an object with the forward() method of openface.TorchNeuralNet that is used instead of the
+        configured network, e.g. for benchmarks. openface is not needed then, and there is no face aligner and no
+        embedding cache
+        """
+        if net is not None:
+            self.align = None
+            self.net = net
+            self.embedding_cache = None
+            return
+
+        if openface is None:
+            raise ImportError('openface is required to load the face recognition network!')
+
+        self.align = load_aligner()
 
         # Load the path to the model from config and load the model
         network_model_directory = tools.load_key_from_config(MODEL_PATH_KEY)
-        self.net = openface.TorchNeuralNet(network_model_directory, IMAGE_DIM)
+        backend = tools.load_key_from_config(BACKEND_KEY, 'openface')
+        if backend == 'binary':
+            self.net = torch_backend.BinaryTorchNeuralNet(network_model_directory, IMAGE_DIM)
+        else:
+            self.net = openface.TorchNeuralNet(network_model_directory, IMAGE_DIM)
+
+        # Representations of images without a fooling pattern are kept on disk between runs
+        self.embedding_cache = None
+        if embedding_cache_path is not None:
+            # The backends return the representations with different precision, so they do not share a cache
+            self.embedding_cache = embedding_cache.EmbeddingCache(embedding_cache_path,
+                                                                  network_model_directory + ' ' + backend)
 
     def calculate_likeness(self, img1, img2):
         """
@@ -55,24 +95,121 @@ class NeuralNetworkTools:
         d = rep1 - rep2
         return np.dot(d, d)
 
-    def calculate_likenesses(self, sources, targets, mask, fooling_pattern):
+    def forward_batch(self, images):
+        """
+        Calculates the representations of a batch of images with the face recognition DNN.
+        If the network supports it, the whole batch is passed to it in a single call
+        :param images: a K x IMAGE_DIM x IMAGE_DIM x 3 uint8 array
+        :return: a K x 128 matrix containing one representation per row
+        """
+        assert images.ndim == 4 and images.shape[1] == IMAGE_DIM and images.shape[2] == IMAGE_DIM
+
+        if len(images) == 0:
+            return np.zeros((0, 128))
+
+        if hasattr(self.net, 'forward_batch'):
+            return np.asarray(self.net.forward_batch(images))
+
+        # openface.TorchNeuralNet only accepts a single image per call
+        return np.array([self.net.forward(img) for img in images])
+
+    def embed_images(self, images, cached=False):
+        """
+        Calculates the representation of each image with the face recognition DNN
+        :param images: list of images
+        :param cached: look the images up in (and add them to) the embedding cache. Only use this for images that are
+        going to be seen again, like unmasked sources and targets
+        :return: a matrix containing one representation per row
+        """
+        if not cached or self.embedding_cache is None:
+            return self.forward_batch(np.array(images, dtype=np.uint8))
+
+        embeddings = [self.embedding_cache.get(img) for img in images]
+        missing = [i for i in range(0, len(images)) if embeddings[i] is None]
+        if len(missing) > 0:
+            missing_embeddings = self.forward_batch(np.array([images[i] for i in missing], dtype=np.uint8))
+            for i, embedding in zip(missing, missing_embeddings):
+                self.embedding_cache.put(images[i], embedding)
+                embeddings[i] = embedding
+            self.embedding_cache.save()
+
+        return np.array(embeddings)
+
+    def calculate_likenesses(self, sources, targets, mask, fooling_pattern, target_embeddings=None):
         """
         Calculates how close the images are to each other for the face recognition DNN
         :param fooling_pattern: The fooling pattern that is overliad on the source images
         :param sources: Source images (they get masked)
         :param targets: Target images
         :param mask: The mask
-        :return: a number between 0 (same image) and a high value (~2) for different faces
+        :param target_embeddings: Precalculated representations of the targets (from embed_images). If given, the
+        targets are not run through the network again
+        :return: a list of numbers between 0 (same image) and a high value (~2) for different faces, ordered by target
+        first and source second
         """
-        results = list()
+        results = self.calculate_likenesses_batch(sources, targets, mask, [fooling_pattern], target_embeddings)
 
-        for target_image in targets:
-            for source_image in sources:
-                blended_image = image_tools.blend(source_image, fooling_pattern, mask)
-                result = self.calculate_likeness(target_image, blended_image)
-                results.append(result)
+        return list(results[0].ravel())
 
-        return results
+    def calculate_likenesses_batch(self, sources, targets, mask, fooling_patterns, target_embeddings=None):
+        """
+        Calculates how close the images are to each other for the face recognition DNN, for a number of fooling
+        patterns at once. All blended images are passed to the network in a single batch
+        :param fooling_patterns: The fooling patterns that are overlaid on the source images
+        :param sources: Source images (they get masked)
+        :param targets: Target images
+        :param mask: The mask
+        :param target_embeddings: Precalculated representations of the targets (from embed_images). If given, the
+        targets are not run through the network again
+        :return: an array of shape (patterns, targets, sources) containing numbers between 0 (same image) and a high
+        value (~2) for different faces
+        """
+        if target_embeddings is None:
+            target_embeddings = self.embed_images(targets)
+
+        blended_images = image_tools.BlendKernel(sources, mask).blend_many(np.array(fooling_patterns))
+        source_embeddings = self.forward_batch(blended_images)
+        source_embeddings = source_embeddings.reshape((len(fooling_patterns), len(sources), -1))
+
+        return squared_distances(target_embeddings, source_embeddings)
+
+    def calculate_unmasked_likenesses(self, sources, targets):
+        """
+        Calculates how close the images are to each other for the face recognition DNN, without any fooling pattern.
+        The representations are taken from the embedding cache if possible
+        :param sources: Source images
+        :param targets: Target images
+        :return: a list of numbers between 0 (same image) and a high value (~2) for different faces, ordered by target
+        first and source second
+        """
+        target_embeddings = self.embed_images(targets, cached=True)
+        source_embeddings = self.embed_images(sources, cached=True)
+
+        return list(squared_distances(target_embeddings, source_embeddings).ravel())
+
+    def calculate_report_likenesses(self, sources, targets, mask, fooling_pattern):
+        """
+        Calculates all likenesses of the final report at once. The unmasked images are looked up in the embedding cache
+        and passed to the network in one batch, the masked sources in another one
+        :param sources: Source images
+        :param targets: Target images
+        :param mask: The mask
+        :param fooling_pattern: The fooling pattern that is overlaid on the source images
+        :return: a dictionary of lists, like calculate_unmasked_likenesses and calculate_likenesses return them:
+        'target_target' (the targets among each other), 'source_target' (unmasked sources and targets),
+        'fooled_target' (masked sources and targets) and 'fooled_source' (masked and unmasked sources)
+        """
+        unmasked_embeddings = self.embed_images(list(sources) + list(targets), cached=True)
+        source_embeddings = unmasked_embeddings[0:len(sources)]
+        target_embeddings = unmasked_embeddings[len(sources):]
+
+        blended_images = image_tools.BlendKernel(sources, mask).blend_many(fooling_pattern[np.newaxis])
+        fooled_embeddings = self.forward_batch(blended_images)
+
+        return {'target_target': list(squared_distances(target_embeddings, target_embeddings).ravel()),
+                'source_target': list(squared_distances(target_embeddings, source_embeddings).ravel()),
+                'fooled_target': list(squared_distances(target_embeddings, fooled_embeddings).ravel()),
+                'fooled_source': list(squared_distances(source_embeddings, fooled_embeddings).ravel())}
 
     def align_face(self, img):
         """
@@ -81,12 +218,48 @@ class NeuralNetworkTools:
         :return: The aligned image
         """
 
-        bb = self.align.getLargestFaceBoundingBox(img)
-        if bb is None:
-            raise Exception("Unable to find a face!")
+        return align_face(self.align, img)
+
+
+def load_aligner():
+    """
+    Loads the dlib face aligner configured in config.json, without the face recognition DNN
+    :return: an openface.AlignDlib object
+    """
+    if openface is None:
+        raise ImportError('openface is required to load the face aligner!')
+
+    # Load the path to dlib from config
+    dlib_face_predictor_directory = tools.load_key_from_config(DLIB_PATH_KEY).encode('ascii', 'ignore')
+    return openface.AlignDlib(dlib_face_predictor_directory)
+
+
+def align_face(align, img):
+    """
+    Aligns a face found in an image and crops it to 96x96
+    :param align: the face aligner (from load_aligner)
+    :param img: the image
+    :return: The aligned image
+    :raises FaceNotFoundError: if there is no face that can be aligned
+    """
+    bb = align.getLargestFaceBoundingBox(img)
+    if bb is None:
+        raise FaceNotFoundError("Unable to find a face!")
+
+    aligned_face = align.align(IMAGE_DIM, img, bb, landmarkIndices=openface.AlignDlib.OUTER_EYES_AND_NOSE)
+    if aligned_face is None:
+        raise FaceNotFoundError("Unable to align image!")
+
+    return aligned_face
 
-        aligned_face = self.align.align(IMAGE_DIM, img, bb, landmarkIndices=openface.AlignDlib.OUTER_EYES_AND_NOSE)
-        if aligned_face is None:
-            raise Exception("Unable to align image!")
 
-        return aligned_face
+def squared_distances(embeddings1, embeddings2):
+    """
+    Calculates the squared euclidean distance between every pair of representations
+    :param embeddings1: matrix with one representation per row (N x 128)
+    :param embeddings2: matrix with one representation per row (M x 128). Additional leading dimensions are allowed
+    :return: a N x M matrix. Entry (i, j) is the distance between embeddings1[i] and embeddings2[j]. If embeddings2 has
+    leading dimensions, they are kept in front
+    """
+    d = embeddings1[:, np.newaxis, :] - embeddings2[..., np.newaxis, :, :]
+    return np.einsum('...k,...k->...', d, d)
@@ -0,0 +1,145 @@
+import collections
+import contextlib
+import json
+import time
+import timeit
+
+# The stages of a particle evaluation, in order
+STAGES = ['render', 'blend', 'forward', 'distance']
+
+
+class StageTimer:
+    def __init__(self, trace_path=None):
+        """
+        Measures how much time the particle evaluations spend in each stage
+        :param trace_path: path of a file that receives one JSON record per evaluated swarm. The stages process the
+        whole swarm at once, so there are no times per particle, but every record contains the fitness of each particle.
+        None disables the trace
+        """
+        self.seconds = collections.OrderedDict((stage, 0.0) for stage in STAGES)
+        self.calls = collections.OrderedDict((stage, 0) for stage in STAGES)
+        self.unrecorded_seconds = dict((stage, 0.0) for stage in STAGES)
+
+        self.trace_file = None
+        if trace_path is not None:
+            self.trace_file = open(trace_path, 'w')
+
+    @contextlib.contextmanager
+    def measure(self, stage):
+        """
+        Context manager that adds the time spent inside it to a stage
+        :param stage: one of STAGES
+        """
+        stage_start = timeit.default_timer()
+        yield
+        self.add(stage, timeit.default_timer() - stage_start)
+
+    def add(self, stage, seconds, calls=1):
+        """
+        Adds time to a stage
+        :param stage: one of STAGES
+        :param seconds: the time spent in the stage
+        :param calls: the number of calls the time was spent in
+        :return: nothing
+        """
+        self.seconds[stage] += seconds
+        self.calls[stage] += calls
+        self.unrecorded_seconds[stage] += seconds
+
+    def record(self, fitness, evaluated):
+        """
+        Writes a trace record for an evaluated swarm, containing the time spent in each stage since the last record
+        :param fitness: the fitness of every particle of the swarm
+        :param evaluated: the number of particles that were not found in the fitness cache
+        :return: nothing
+        """
+        if self.trace_file is not None:
+            trace_record = {'time': time.time(), 'particles': len(fitness), 'evaluated': evaluated,
+                            'seconds': self.unrecorded_seconds, 'best_fitness': float(min(fitness)),
+                            'fitness': [float(value) for value in fitness]}
+            self.trace_file.write(json.dumps(trace_record) + '\n')
+            # An interrupted run keeps its trace up to the last evaluated swarm
+            self.trace_file.flush()
+
+        self.unrecorded_seconds = dict((stage, 0.0) for stage in STAGES)
+
+    def summary(self):
+        """
+        Describes the time spent in each stage
+        :return: a string with one line per stage
+        """
+        lines = list()
+        for stage in STAGES:
+            per_call = self.seconds[stage] / max(self.calls[stage], 1)
+            lines.append('{:10s} {:10.2f} seconds in {:6d} calls, {:10.2f} ms per call'.format(
+                stage, self.seconds[stage], self.calls[stage], 1000 * per_call))
+        return '\n'.join(lines)
+
+    def close(self):
+        """
+        Closes the trace file
+        :return: nothing
+        """
+        if self.trace_file is not None:
+            self.trace_file.close()
+            self.trace_file = None
+
+
+class ProgressReporter:
+    def __init__(self, total_evaluations, interval=10.0, completed_evaluations=0):
+        """
+        Prints the progress of the optimization after every iteration, and in between at most every interval seconds
+        :param total_evaluations: the number of particle evaluations of the whole optimization
+        :param interval: the minimum number of seconds between two progress reports within an iteration
+        :param completed_evaluations: the number of evaluations that were done before (when resuming)
+        """
+        self.total_evaluations = total_evaluations
+        self.interval = interval
+        self.initial_evaluations = completed_evaluations
+        self.completed_evaluations = completed_evaluations
+        self.best_fitness = None
+
+        self.start = time.time()
+        self.last_report = self.start
+
+    def count(self, number_of_evaluations):
+        """
+        Counts finished evaluations. Prints the progress if the last report is older than the interval
+        :param number_of_evaluations: the number of particles evaluated since the last call
+        :return: nothing
+        """
+        self.completed_evaluations += number_of_evaluations
+        if time.time() - self.last_report >= self.interval:
+            self.report()
+
+    def iteration(self, iteration, best_position, best_fitness):
+        """
+        Prints the progress after an iteration. Can be passed to swarm_tools.pso as callback
+        :param iteration: the number of the iteration that was just completed (0 for the initialization)
+        :param best_position: the swarm's best position
+        :param best_fitness: the swarm's best fitness
+        :return: nothing
+        """
+        self.best_fitness = best_fitness
+        self.report(iteration)
+
+    def report(self, iteration=None):
+        """
+        Prints the number of evaluations so far, an estimate of the remaining time and the best fitness
+        :param iteration: the number of the iteration that was just completed, if any
+        :return: nothing
+        """
+        now = time.time()
+        run_time = now - self.start
+        evaluations_remaining = self.total_evaluations - self.completed_evaluations
+        time_remaining = run_time / max(self.completed_evaluations - self.initial_evaluations, 1) * evaluations_remaining
+
+        line = 'Optimization run {:5d} of {}, optimizing for {:8.1f} seconds, estimated time remaing {:8.1f} seconds'\
+            .format(self.completed_evaluations, self.total_evaluations, run_time, time_remaining)
+        if iteration is not None:
+            line = 'Iteration {:4d}: '.format(iteration) + line
+        if self.best_fitness is not None:
+            line += ', best fitness {:.6f}'.format(self.best_fitness)
+        print(line)
+
+        self.last_report = now
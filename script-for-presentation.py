@@ -73,25 +73,20 @@ fooling_generator = image_tools.create_fooling_pattern
 ##### END FOOLING PATTERN GENERATOR DEFINITION #####
 
 print("rep of face 5")
-x = nn.net.forward(source_images[2])
+x = nn.embed_images([source_images[2]], cached=True)[0]
 print(str(x))
 
-empty_mask = np.multiply(0,
-                         np.ones((neural_network_tools.IMAGE_DIM, neural_network_tools.IMAGE_DIM, 1), dtype=np.uint8))
-empty_pattern = np.multiply(255, np.ones((neural_network_tools.IMAGE_DIM, neural_network_tools.IMAGE_DIM, 3),
-                                         dtype=np.uint8))
-
-likenesses_target_target = nn.calculate_likenesses(target_images, target_images, empty_mask, empty_pattern)
+likenesses_target_target = nn.calculate_unmasked_likenesses(target_images, target_images)
 print("Likenesses between target and itself:\n" + str(likenesses_target_target))
 print("Mean: " + str(np.mean(likenesses_target_target)) + ", Standard deviation: " + str(
     np.std(likenesses_target_target)) + "\n")
 
-likenesses_source_source = nn.calculate_likenesses(source_images, source_images, empty_mask, empty_pattern)
+likenesses_source_source = nn.calculate_unmasked_likenesses(source_images, source_images)
 print("Likenesses between source and itself:\n" + str(likenesses_source_source))
 print("Mean: " + str(np.mean(likenesses_source_source)) + ", Standard deviation: " + str(
     np.std(likenesses_source_source)) + "\n")
 
-likenesses_source_target = nn.calculate_likenesses(source_images, target_images, empty_mask, empty_pattern)
+likenesses_source_target = nn.calculate_unmasked_likenesses(source_images, target_images)
 print("Likenesses between target and source:\n" + str(likenesses_source_target))
 print("Mean: " + str(np.mean(likenesses_source_target)) + ", Standard deviation: " + str(
     np.std(likenesses_source_target)) + "\n")
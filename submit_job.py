@@ -0,0 +1,35 @@
+import argparse
+
+import daemon_tools
+
+# Main program start: Argument paring
+parser = argparse.ArgumentParser()
+parser.add_argument('--socket', help="Path of the Unix socket of daemon.py.", default='optimization.sock')
+parser.add_argument('--particles', type=int, help="Number of particles in the particle swarm optimization.",
+                    default=daemon_tools.JOB_DEFAULTS['particles'])
+parser.add_argument('--iterations', type=int, help="Number of iterations of the optimization.",
+                    default=daemon_tools.JOB_DEFAULTS['iterations'])
+parser.add_argument('--images', type=int, help="Number of images to compare.",
+                    default=daemon_tools.JOB_DEFAULTS['images'])
+parser.add_argument('--dodging', action='store_true')
+parser.add_argument('--sources', help="Dataset created by build_dataset.py to take the source images from.",
+                    default=None)
+parser.add_argument('--targets', help="Dataset created by build_dataset.py to take the target images from.",
+                    default=None)
+parser.add_argument('--mask', help="The mask image.", default=daemon_tools.JOB_DEFAULTS['mask'])
+parser.add_argument('--seed', type=int, help="Seed for the random start values of the particles.", default=None)
+parser.add_argument('--racing', type=int, help="Number of images every particle is first evaluated on.",
+                    default=0)
+parser.add_argument('--shutdown', action='store_true', help="Stop the daemon instead of sending a job.")
+args = parser.parse_args()
+
+if args.shutdown:
+    daemon_tools.submit_job(args.socket, {'command': 'shutdown'})
+else:
+    job = {'particles': args.particles, 'iterations': args.iterations, 'images': args.images,
+           'dodging': args.dodging, 'sources': args.sources, 'targets': args.targets, 'mask': args.mask,
+           'seed': args.seed, 'racing': args.racing}
+    result = daemon_tools.submit_job(args.socket, job)
+    print("Best fitness {} after {:.1f} seconds.".format(result['fitness'], result['seconds']))
+    print("Likenesses with fooling pattern:\n" + str(result['likenesses']))
+    print("Parameters:\n" + str(result['parameters']))
@@ -0,0 +1,173 @@
+import numpy as np
+
+
+SURROGATE_HISTORY_SIZE = 500
+
+
+class RbfSurrogate:
+    def __init__(self, lower_bounds, upper_bounds, history_size=SURROGATE_HISTORY_SIZE, regularization=1e-3):
+        """
+        A cheap model of the objective function: Gaussian radial basis function regression over the particles
+        evaluated so far. The parameters are rounded like create_fooling_pattern rounds them and scaled to [0, 1]
+        :param lower_bounds: the lower bounds of the parameters
+        :param upper_bounds: the upper bounds of the parameters
+        :param history_size: the number of most recent evaluations the model is fitted to
+        :param regularization: added to the diagonal of the kernel matrix, smooths out noise
+        """
+        self.lower_bounds = np.array(lower_bounds, dtype=float)
+        self.upper_bounds = np.array(upper_bounds, dtype=float)
+        self.history_size = history_size
+        self.regularization = regularization
+
+        self.samples = np.zeros((0, len(self.lower_bounds)))
+        self.values = np.zeros(0)
+        self.weights = None
+        self.offset = 0.0
+        self.width = 1.0
+
+    def __len__(self):
+        return len(self.values)
+
+    def quantize(self, positions):
+        """
+        Rounds and scales parameter vectors
+        :param positions: matrix containing one parameter vector per row
+        :return: the scaled matrix
+        """
+        return (np.round(positions) - self.lower_bounds) / (self.upper_bounds - self.lower_bounds)
+
+    def add(self, positions, values):
+        """
+        Adds evaluated particles. Values that are not finite are ignored
+        :param positions: matrix containing one parameter vector per row
+        :param values: the objective value of every row
+        :return: nothing
+        """
+        finite = np.isfinite(values)
+        self.samples = np.concatenate((self.samples, self.quantize(positions[finite])))[-self.history_size:]
+        self.values = np.concatenate((self.values, values[finite]))[-self.history_size:]
+        self.weights = None
+
+    def fit(self):
+        """
+        Fits the model to the added particles. Called by predict when necessary
+        :return: nothing
+        """
+        distances = squared_distances(self.samples, self.samples)
+        # The kernel width follows the typical distance between the samples
+        median_distance = np.median(distances[np.triu_indices(len(self.samples), 1)]) if len(self.samples) > 1 else 0
+        self.width = max(median_distance, 1e-12)
+
+        self.offset = np.mean(self.values)
+        kernel = np.exp(-distances / self.width) + self.regularization * np.eye(len(self.samples))
+        self.weights = np.linalg.solve(kernel, self.values - self.offset)
+
+    def predict(self, positions):
+        """
+        Predicts the objective values of parameter vectors
+        :param positions: matrix containing one parameter vector per row
+        :return: a tuple of the predicted values and the squared distance of every row to the closest added particle
+        """
+        if self.weights is None:
+            self.fit()
+
+        distances = squared_distances(self.quantize(positions), self.samples)
+        predictions = self.offset + np.dot(np.exp(-distances / self.width), self.weights)
+        return predictions, np.min(distances, axis=1)
+
+
+class SurrogateScreeningEvaluator:
+    def __init__(self, evaluator, lower_bounds, upper_bounds, fraction, exploration=0.1, progress=None,
+                 history_size=SURROGATE_HISTORY_SIZE):
+        """
+        Objective function for swarm_tools.pso that ranks the particles with an RbfSurrogate and only passes the most
+        promising ones to the real objective function. Particles that are not evaluated get an infinite objective
+        value, so they never become a best position. All particles are evaluated until the surrogate has seen as many
+        particles as there are in the swarm
+        :param evaluator: the real objective function, e.g. a SwarmEvaluator
+        :param lower_bounds: the lower bounds of the parameters
+        :param upper_bounds: the upper bounds of the parameters
+        :param fraction: the fraction of the swarm with the best predictions that is evaluated
+        :param exploration: the fraction of the swarm that is evaluated in addition because it is furthest away from
+        all particles the surrogate knows
+        :param progress: function that is called with the number of particles that were not evaluated
+        :param history_size: the number of most recent evaluations the surrogate is fitted to
+        """
+        self.evaluator = evaluator
+        self.fraction = fraction
+        self.exploration = exploration
+        self.progress = progress
+        self.surrogate = RbfSurrogate(lower_bounds, upper_bounds, history_size=history_size)
+
+        self.evaluated = 0
+        self.skipped = 0
+        self.absolute_errors = list()
+        self.exact = None
+
+    def __call__(self, swarm_parameters, thresholds=None):
+        """
+        Returns the objective values of the screened particles and infinity for all others
+        :param swarm_parameters: matrix containing the generator parameters of one particle per row
+        :param thresholds: passed on to the real objective function for the screened particles
+        :return: the objective value of every particle
+        """
+        number_of_particles = len(swarm_parameters)
+        predictions = None
+        if len(self.surrogate) < number_of_particles:
+            selected = np.arange(number_of_particles)
+        else:
+            (predictions, distances) = self.surrogate.predict(swarm_parameters)
+            number_of_promising = int(np.ceil(self.fraction * number_of_particles))
+            number_of_exploring = min(int(np.ceil(self.exploration * number_of_particles)),
+                                      number_of_particles - number_of_promising)
+
+            order = np.argsort(predictions, kind='mergesort')
+            rest = order[number_of_promising:]
+            exploring = rest[np.argsort(-distances[rest], kind='mergesort')[0:number_of_exploring]]
+            selected = np.sort(np.concatenate((order[0:number_of_promising], exploring)))
+
+        fitness = np.inf * np.ones(number_of_particles)
+        if thresholds is None:
+            fitness[selected] = self.evaluator(swarm_parameters[selected])
+        else:
+            fitness[selected] = self.evaluator(swarm_parameters[selected], np.asarray(thresholds)[selected])
+
+        # Particles that were not evaluated have no fitness at all
+        self.exact = np.zeros(number_of_particles, dtype=bool)
+        self.exact[selected] = getattr(self.evaluator, 'exact', True)
+
+        # The surrogate only learns real objective values, not the bounds of particles that dropped out of a race
+        learned = selected[self.exact[selected] & np.isfinite(fitness[selected])]
+        if predictions is not None:
+            self.absolute_errors.extend(np.abs(predictions[learned] - fitness[learned]))
+        self.surrogate.add(swarm_parameters[learned], fitness[learned])
+
+        self.evaluated += len(selected)
+        self.skipped += number_of_particles - len(selected)
+        if self.progress is not None and len(selected) < number_of_particles:
+            self.progress(number_of_particles - len(selected))
+        return fitness
+
+    def statistics(self):
+        """
+        Returns how well the screening worked
+        :return: a tuple of the number of evaluated particles, the number of skipped particles and the mean absolute
+        error of the predictions for the evaluated particles with an exact objective value (None before the first
+        prediction)
+        """
+        mean_absolute_error = None
+        if len(self.absolute_errors) > 0:
+            mean_absolute_error = float(np.mean(self.absolute_errors))
+        return self.evaluated, self.skipped, mean_absolute_error
+
+
+def squared_distances(positions1, positions2):
+    """
+    Calculates the squared euclidean distances between two sets of vectors
+    :param positions1: matrix containing one vector per row
+    :param positions2: matrix containing one vector per row
+    :return: matrix with one row per vector of positions1 and one column per vector of positions2
+    """
+    distances = np.sum(positions1 ** 2, axis=1)[:, np.newaxis] + np.sum(positions2 ** 2, axis=1)[np.newaxis, :] \
+        - 2 * np.dot(positions1, positions2.T)
+    return np.maximum(distances, 0)
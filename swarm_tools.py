@@ -0,0 +1,175 @@
+import os
+
+import numpy as np
+
+
+def pso(func, lb, ub, swarmsize=100, omega=0.5, phip=0.5, phig=0.5, maxiter=100, minstep=1e-8, minfunc=1e-8,
+        debug=False, random_state=None, checkpoint=None, resume=None, callback=None, thresholds=False,
+        initial_positions=None, evaluations=None):
+    """
+    Particle swarm optimization with the same parameters as pyswarm.pso. Instead of calling the objective function
+    for one particle at a time, it is called once per iteration with the positions of the whole swarm.
+    Unlike pyswarm, the swarm's best position is updated after every iteration instead of after every particle
+    :param func: the objective function. Takes a swarmsize x D matrix of positions, returns a vector of swarmsize values
+    :param lb: the lower bounds of the parameters (length D)
+    :param ub: the upper bounds of the parameters (length D)
+    :param swarmsize: the number of particles in the swarm
+    :param omega: particle velocity scaling factor
+    :param phip: scaling factor to search away from the particle's best known position
+    :param phig: scaling factor to search away from the swarm's best known position
+    :param maxiter: the maximum number of iterations
+    :param minstep: the minimum stepsize of the swarm's best position before the search terminates
+    :param minfunc: the minimum change of the swarm's best objective value before the search terminates
+    :param debug: print the swarm's best position after every iteration
+    :param random_state: a numpy RandomState to draw from. If None, the global numpy random generator is used
+    :param checkpoint: path of a file the state of the swarm is written to after every iteration
+    :param resume: path of a checkpoint to continue from. The particles in it are not evaluated again
+    :param callback: function that is called after every iteration with the number of the iteration (0 for the
+    initialization), the swarm's best position and its objective value
+    :param thresholds: if True, func is called with the objective values of the particles' best positions as second
+    argument. For particles that cannot beat them, func may return any value that is not lower
+    :param initial_positions: matrix of up to swarmsize positions the first particles start at, e.g. good positions
+    from earlier runs. The other particles start at random positions
+    :param evaluations: function without arguments that returns the number of evaluations done so far, e.g. the count
+    of a profiling_tools.ProgressReporter. It is stored in the checkpoints. Without it, every particle of every
+    iteration counts as one evaluation
+    :return: a tuple containing the swarm's best position and its objective value
+    """
+    lb = np.array(lb, dtype=float)
+    ub = np.array(ub, dtype=float)
+    assert len(lb) == len(ub), 'Lower- and upper-bounds must be the same length'
+    assert hasattr(func, '__call__'), 'Invalid function handle'
+    assert np.all(ub > lb), 'All upper-bound values must be greater than lower-bound values'
+
+    if random_state is None:
+        random_state = np.random
+
+    vhigh = np.abs(ub - lb)
+    vlow = -vhigh
+
+    if resume is not None:
+        state = load_checkpoint(resume)
+        if state['x'].shape != (swarmsize, len(lb)):
+            raise ValueError('The checkpoint does not match the swarm size and number of parameters!')
+        (x, v, p, fp, g, fg) = (state['x'], state['v'], state['p'], state['fp'], state['g'], state['fg'])
+        random_state.set_state(state['random_state'])
+        first_iteration = state['iteration'] + 1
+    else:
+        # Initialize the particle swarm
+        x = lb + random_state.rand(swarmsize, len(lb)) * (ub - lb)
+        v = vlow + random_state.rand(swarmsize, len(lb)) * (vhigh - vlow)
+        if initial_positions is not None:
+            initial_positions = np.asarray(initial_positions, dtype=float)[0:swarmsize]
+            x[0:len(initial_positions)] = np.clip(initial_positions, lb, ub)
+        p = x.copy()
+        fp = np.asarray(func(x), dtype=float)
+
+        best = np.argmin(fp)
+        g = p[best].copy()
+        fg = fp[best]
+        first_iteration = 1
+
+        if checkpoint is not None:
+            save_checkpoint(checkpoint, x, v, p, fp, g, fg, random_state, 0, evaluations)
+
+        if callback is not None:
+            callback(0, g, fg)
+
+    for iteration in range(first_iteration, maxiter + 1):
+        rp = random_state.uniform(size=x.shape)
+        rg = random_state.uniform(size=x.shape)
+
+        # Update the velocities and positions of all particles at once, clipped to the bounds
+        v = omega * v + phip * rp * (p - x) + phig * rg * (g - x)
+        x = np.clip(x + v, lb, ub)
+        if thresholds:
+            fx = np.asarray(func(x, fp.copy()), dtype=float)
+        else:
+            fx = np.asarray(func(x), dtype=float)
+
+        # Update the particles' best positions
+        improved = fx < fp
+        p[improved] = x[improved]
+        fp[improved] = fx[improved]
+
+        # Update the swarm's best position
+        stop_reason = None
+        best = np.argmin(fp)
+        if fp[best] < fg:
+            stepsize = np.sqrt(np.sum((g - p[best]) ** 2))
+            if np.abs(fg - fp[best]) <= minfunc:
+                stop_reason = 'Swarm best objective change less than {:}'.format(minfunc)
+            elif stepsize <= minstep:
+                stop_reason = 'Swarm best position change less than {:}'.format(minstep)
+
+            g = p[best].copy()
+            fg = fp[best]
+
+        # The last iteration is saved and reported even if the search stops early
+        if checkpoint is not None:
+            save_checkpoint(checkpoint, x, v, p, fp, g, fg, random_state, iteration, evaluations)
+
+        if callback is not None:
+            callback(iteration, g, fg)
+
+        if debug:
+            print('Best after iteration {:}: {:} {:}'.format(iteration, g, fg))
+
+        if stop_reason is not None:
+            print('Stopping search: ' + stop_reason)
+            return g, fg
+
+    print('Stopping search: maximum iterations reached --> {:}'.format(maxiter))
+    return g, fg
+
+
+def save_checkpoint(path, x, v, p, fp, g, fg, random_state, iteration, evaluations=None):
+    """
+    Writes the state of the swarm after an iteration to a file. The file is replaced atomically, so an interrupted
+    write leaves the previous checkpoint intact
+    :param path: the path of the checkpoint
+    :param x: the positions of the particles
+    :param v: the velocities of the particles
+    :param p: the best positions of the particles
+    :param fp: the objective values of the best positions of the particles
+    :param g: the swarm's best position
+    :param fg: the objective value of the swarm's best position
+    :param random_state: the random generator used by the optimization
+    :param iteration: the number of the iteration that was just completed (0 for the initialization)
+    :param evaluations: function without arguments that returns the number of evaluations done so far. If None,
+    every particle of every iteration counts as one evaluation
+    :return: nothing
+    """
+    completed_evaluations = len(x) * (iteration + 1)
+    if evaluations is not None:
+        completed_evaluations = evaluations()
+
+    (generator_name, keys, position, has_gauss, cached_gaussian) = random_state.get_state()
+
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as checkpoint_file:
+        np.savez(checkpoint_file, x=x, v=v, p=p, fp=fp, g=g, fg=fg, iteration=iteration,
+                 evaluations=completed_evaluations, random_generator=generator_name, random_keys=keys,
+                 random_position=position, random_has_gauss=has_gauss, random_cached_gaussian=cached_gaussian)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.rename(temporary_path, path)
+
+
+def load_checkpoint(path):
+    """
+    Reads a checkpoint written by save_checkpoint
+    :param path: the path of the checkpoint
+    :return: a dictionary containing the arrays x, v, p, fp, g and the values fg, iteration, evaluations and
+    random_state (a tuple for RandomState.set_state)
+    """
+    with np.load(path) as checkpoint_file:
+        state = dict((key, checkpoint_file[key]) for key in ['x', 'v', 'p', 'fp', 'g'])
+        state['fg'] = float(checkpoint_file['fg'])
+        state['iteration'] = int(checkpoint_file['iteration'])
+        state['evaluations'] = int(checkpoint_file['evaluations'])
+        state['random_state'] = (str(checkpoint_file['random_generator']), checkpoint_file['random_keys'],
+                                 int(checkpoint_file['random_position']), int(checkpoint_file['random_has_gauss']),
+                                 float(checkpoint_file['random_cached_gaussian']))
+
+    return state
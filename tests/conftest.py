@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules are not installed as a package, they are imported from the repository root like the scripts do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
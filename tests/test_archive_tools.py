@@ -0,0 +1,59 @@
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+import archive_tools
+
+
+def test_archive_keeps_rows_between_runs():
+    archive_path = os.path.join(tempfile.mkdtemp(), 'archive')
+    archive = archive_tools.EvaluationArchive(archive_path, 2)
+    archive.append(np.array([[1.0, 1.0], [2.0, 2.0], [3.0, 3.0]]), np.array([0.3, 0.1, 0.2]), False, 'a' * 40,
+                   'm' * 40)
+    archive.append(np.array([[4.0, 4.0], [2.0, 2.0]]), np.array([0.0, 0.1]), True, 'a' * 40, 'm' * 40)
+
+    reopened_archive = archive_tools.EvaluationArchive(archive_path, 2)
+    assert len(reopened_archive) == 5
+    # Only the same mode and mask, best first, and every position only once
+    assert np.array_equal(reopened_archive.best(5, False, 'm' * 40), [[2.0, 2.0], [3.0, 3.0], [1.0, 1.0]])
+    assert len(reopened_archive.best(5, False, 'x' * 40)) == 0
+
+    with pytest.raises(ValueError):
+        archive_tools.EvaluationArchive(archive_path, 3)
+
+
+def test_archive_drops_incomplete_rows():
+    archive_path = os.path.join(tempfile.mkdtemp(), 'archive')
+    archive = archive_tools.EvaluationArchive(archive_path, 2)
+    archive.append(np.array([[1.0, 1.0]]), np.array([0.3]), False, 'a' * 40, 'm' * 40)
+
+    # An append that was interrupted after the first column
+    with open(archive.column_path('parameters'), 'ab') as column_file:
+        column_file.write(np.zeros(2, dtype=np.float32).tobytes())
+
+    reopened_archive = archive_tools.EvaluationArchive(archive_path, 2)
+    assert len(reopened_archive) == 1
+    assert np.array_equal(reopened_archive.column('parameters'), [[1.0, 1.0]])
+
+
+def test_read_only_archive_has_no_side_effects():
+    archive_path = os.path.join(tempfile.mkdtemp(), 'archive')
+    with pytest.raises(IOError):
+        archive_tools.EvaluationArchive(archive_path, 2, writable=False)
+    assert not os.path.exists(archive_path)
+
+    archive = archive_tools.EvaluationArchive(archive_path, 2)
+    archive.append(np.array([[1.0, 1.0]]), np.array([0.3]), False, 'a' * 40, 'm' * 40)
+    # A row that another run is still appending
+    with open(archive.column_path('parameters'), 'ab') as column_file:
+        column_file.write(np.zeros(2, dtype=np.float32).tobytes())
+    parameters_size = os.path.getsize(archive.column_path('parameters'))
+
+    reader = archive_tools.EvaluationArchive(archive_path, 2, writable=False)
+    assert len(reader) == 1
+    assert np.array_equal(reader.best(5, False, 'm' * 40), [[1.0, 1.0]])
+    assert os.path.getsize(archive.column_path('parameters')) == parameters_size
+    with pytest.raises(IOError):
+        reader.append(np.array([[2.0, 2.0]]), np.array([0.1]), False, 'a' * 40, 'm' * 40)
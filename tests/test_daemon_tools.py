@@ -0,0 +1,66 @@
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import daemon_tools
+import neural_network_tools
+
+
+class FakeNetwork:
+    def forward(self, img):
+        """
+        Stands in for openface.TorchNeuralNet: the representation is the mean of each colour layer
+        """
+        rep = np.zeros(128)
+        rep[0:3] = np.mean(img, axis=(0, 1)) / 255.0
+        return rep
+
+
+def send_line(socket_path, line):
+    client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client_socket.connect(socket_path)
+        connection_file = client_socket.makefile('rwb')
+        connection_file.write(line)
+        connection_file.flush()
+        client_socket.shutdown(socket.SHUT_WR)
+        response = connection_file.readline()
+        connection_file.close()
+    finally:
+        client_socket.close()
+    return json.loads(response.decode('utf-8'))
+
+
+def test_bad_requests_do_not_stop_the_server():
+    socket_path = os.path.join(tempfile.mkdtemp(), 'optimization.sock')
+    server = daemon_tools.OptimizationServer(socket_path, nn=neural_network_tools.NeuralNetworkTools(net=FakeNetwork()))
+    server_thread = threading.Thread(target=server.serve)
+    server_thread.daemon = True
+    server_thread.start()
+    while not os.path.exists(socket_path):
+        time.sleep(0.01)
+
+    # A client that connects and leaves without sending anything
+    client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client_socket.connect(socket_path)
+    client_socket.close()
+
+    for line in [b'', b'{"particles": \n', b'[1, 2]\n']:
+        response = send_line(socket_path, line)
+        assert response['status'] == 'error'
+    assert server_thread.is_alive()
+
+    with pytest.raises(RuntimeError):
+        daemon_tools.submit_job(socket_path, {'sources': os.path.join(socket_path, 'missing')})
+    assert server_thread.is_alive()
+
+    assert daemon_tools.submit_job(socket_path, {'command': 'shutdown'}) is None
+    server_thread.join(10)
+    assert not server_thread.is_alive()
+    assert not os.path.exists(socket_path)
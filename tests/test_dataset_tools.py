@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+import dataset_tools
+import image_tools
+
+
+class FaceAligner:
+    def getLargestFaceBoundingBox(self, img):
+        """
+        Stands in for openface.AlignDlib on a photo without a face
+        """
+        return None
+
+
+def test_only_photos_without_faces_are_left_out(monkeypatch):
+    monkeypatch.setattr(dataset_tools, '_worker_aligner', FaceAligner())
+    monkeypatch.setattr(image_tools, 'load_image', lambda path, layers: np.zeros((200, 200, 3), dtype=np.uint8))
+    assert dataset_tools._align_photo('empty.png') == ('empty.png', None)
+
+    def load_missing_image(path, layers):
+        raise IOError('No such file: ' + path)
+
+    monkeypatch.setattr(image_tools, 'load_image', load_missing_image)
+    with pytest.raises(IOError):
+        dataset_tools._align_photo('missing.png')
@@ -0,0 +1,90 @@
+import threading
+
+import numpy as np
+import pytest
+
+import distributed_tools
+import image_tools
+import neural_network_tools
+
+IMAGE_DIM = neural_network_tools.IMAGE_DIM
+
+
+class FakeNetwork:
+    def __init__(self, working_forwards=None):
+        """
+        Stands in for openface.TorchNeuralNet: the representation is the mean of each colour layer
+        :param working_forwards: the number of images after which every image raises an error. None never fails
+        """
+        self.working_forwards = working_forwards
+
+    def forward(self, img):
+        if self.working_forwards is not None:
+            if self.working_forwards == 0:
+                raise ValueError('Broken image!')
+            self.working_forwards -= 1
+        rep = np.zeros(128)
+        rep[0:3] = np.mean(img, axis=(0, 1)) / 255.0
+        return rep
+
+
+def create_evaluator(**kwargs):
+    random_state = np.random.RandomState(1)
+    sources = [random_state.randint(0, 256, (IMAGE_DIM, IMAGE_DIM, 3)).astype(np.uint8) for _ in range(0, 2)]
+    mask = np.zeros((IMAGE_DIM, IMAGE_DIM, 1), dtype=np.float32)
+    mask[0:38] = 255
+    return distributed_tools.DistributedSwarmEvaluator(0, sources, sources, mask, False, host='localhost',
+                                                       batch_size=2, **kwargs)
+
+
+def create_swarm(number_of_particles):
+    (lower_bounds, upper_bounds) = image_tools.create_fooling_pattern_bounds()
+    random_state = np.random.RandomState(2)
+    # The upper half of the bounds, so no line has a thickness of 0
+    return lower_bounds + (1 + random_state.rand(number_of_particles, len(lower_bounds))) / 2 * (upper_bounds -
+                                                                                                 lower_bounds)
+
+
+def start_worker(evaluator, working_forwards=None):
+    nn = neural_network_tools.NeuralNetworkTools(net=FakeNetwork(working_forwards))
+    worker_thread = threading.Thread(target=distributed_tools.run_worker,
+                                     args=('localhost', evaluator.server_socket.getsockname()[1], nn))
+    worker_thread.daemon = True
+    worker_thread.start()
+    return worker_thread
+
+
+def test_workers_evaluate_batches():
+    evaluator = create_evaluator()
+    worker_threads = [start_worker(evaluator) for _ in range(0, 2)]
+
+    fitness = evaluator(create_swarm(5))
+    assert fitness.shape == (5,)
+    assert np.all(evaluator.exact)
+
+    evaluator.close()
+    for worker_thread in worker_threads:
+        worker_thread.join()
+
+
+@pytest.mark.parametrize('working_forwards', [0, 2])
+def test_failing_batch_raises_instead_of_hanging(working_forwards):
+    # With 0, the setup of the workers fails already. With 2, the targets are embedded and the batches fail
+    evaluator = create_evaluator(timeout=30)
+    worker_threads = [start_worker(evaluator, working_forwards) for _ in range(0, 2)]
+
+    with pytest.raises(RuntimeError, match='Broken image'):
+        evaluator(create_swarm(3))
+
+    # The workers survive the error and stop normally
+    evaluator.close()
+    for worker_thread in worker_threads:
+        worker_thread.join()
+
+
+def test_missing_workers_time_out():
+    evaluator = create_evaluator(timeout=0.1)
+
+    with pytest.raises(RuntimeError, match='No worker'):
+        evaluator(create_swarm(3))
+    evaluator.close()
@@ -0,0 +1,53 @@
+import multiprocessing
+import os
+import tempfile
+
+import numpy as np
+
+import embedding_cache
+
+
+def create_image(number):
+    return np.full((4, 4, 3), number, dtype=np.uint8)
+
+
+def create_embedding(number):
+    return np.full(128, number, dtype=float)
+
+
+def save_images(arguments):
+    (path, numbers) = arguments
+    for number in numbers:
+        cache = embedding_cache.EmbeddingCache(path, 'model')
+        cache.put(create_image(number), create_embedding(number))
+        cache.save()
+
+
+def test_caches_on_the_same_path_keep_each_others_rows():
+    path = os.path.join(tempfile.mkdtemp(), 'embedding_cache')
+    first_cache = embedding_cache.EmbeddingCache(path, 'model')
+    second_cache = embedding_cache.EmbeddingCache(path, 'model')
+
+    first_cache.put(create_image(1), create_embedding(1))
+    second_cache.put(create_image(2), create_embedding(2))
+    first_cache.save()
+    second_cache.save()
+
+    cache = embedding_cache.EmbeddingCache(path, 'model')
+    for number in [1, 2]:
+        assert np.array_equal(cache.get(create_image(number)), create_embedding(number))
+
+
+def test_concurrent_saves_from_processes():
+    path = os.path.join(tempfile.mkdtemp(), 'embedding_cache')
+    pool = multiprocessing.Pool(4)
+    try:
+        pool.map(save_images, [(path, range(worker, 100, 4)) for worker in range(0, 4)])
+    finally:
+        pool.close()
+        pool.join()
+
+    cache = embedding_cache.EmbeddingCache(path, 'model')
+    for number in range(0, 100):
+        assert np.array_equal(cache.get(create_image(number)), create_embedding(number))
+    assert [name for name in os.listdir(os.path.dirname(path)) if '.tmp' in name] == []
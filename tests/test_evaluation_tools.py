@@ -0,0 +1,145 @@
+import numpy as np
+
+import evaluation_tools
+import image_tools
+import neural_network_tools
+
+IMAGE_DIM = neural_network_tools.IMAGE_DIM
+
+
+class FakeNetwork:
+    def __init__(self):
+        """
+        Stands in for openface.TorchNeuralNet: a fixed random projection of the downsampled image to a representation
+        of unit length. Counts the images passed through it
+        """
+        self.projection = np.random.RandomState(0).randn(128, (IMAGE_DIM // 8) ** 2 * 3)
+        self.forwards = 0
+
+    def forward(self, img):
+        self.forwards += 1
+        rep = np.dot(self.projection, img[::8, ::8].ravel() / 255.0 - 0.5)
+        return rep / np.linalg.norm(rep)
+
+
+def fooling_generator(size, parameters):
+    """
+    A fooling pattern filled with the grey value of the first parameter
+    """
+    return np.full((size, size, 3), int(parameters[0]), dtype=np.uint8)
+
+
+def create_evaluator(fitness_cache_size=evaluation_tools.FITNESS_CACHE_SIZE, racing_sources=0, dodging=False):
+    random_state = np.random.RandomState(1)
+    sources = [random_state.randint(0, 256, (IMAGE_DIM, IMAGE_DIM, 3)).astype(np.uint8) for _ in range(0, 4)]
+    targets = [random_state.randint(0, 256, (IMAGE_DIM, IMAGE_DIM, 3)).astype(np.uint8) for _ in range(0, 2)]
+    mask = np.zeros((IMAGE_DIM, IMAGE_DIM, 1), dtype=np.float32)
+    mask[0:38] = 255
+
+    nn = neural_network_tools.NeuralNetworkTools(net=FakeNetwork())
+    return evaluation_tools.SwarmEvaluator(nn, sources, targets, mask, fooling_generator, dodging,
+                                           fitness_cache_size=fitness_cache_size, racing_sources=racing_sources)
+
+
+def test_racing_keeps_exact_fitness_below_thresholds():
+    parameters = np.array([[0.0], [60.0], [120.0], [180.0], [240.0]])
+
+    for dodging in [False, True]:
+        exact_fitness = create_evaluator(racing_sources=0, dodging=dodging)(parameters)
+        thresholds = np.full(len(parameters), np.median(exact_fitness))
+        evaluator = create_evaluator(racing_sources=1, dodging=dodging)
+        raced_fitness = evaluator(parameters, thresholds)
+
+        # Exact results are the real fitness, the others are lower bounds that are not below their threshold
+        assert np.allclose(raced_fitness[evaluator.exact], exact_fitness[evaluator.exact])
+        assert np.all(raced_fitness[~evaluator.exact] >= thresholds[~evaluator.exact])
+        assert np.all(raced_fitness[~evaluator.exact] <= exact_fitness[~evaluator.exact] + 1e-12)
+        assert np.all(evaluator.exact[exact_fitness < thresholds])
+
+
+def test_racing_skips_forwards_of_dropped_particles():
+    evaluator = create_evaluator(fitness_cache_size=0, racing_sources=1)
+    evaluator(np.array([[0.0], [100.0]]), np.array([0.0, np.inf]))
+
+    assert list(evaluator.exact) == [False, True]
+    (forwards, skipped_forwards) = evaluator.racing_statistics()
+    assert forwards + skipped_forwards == 2 * 4
+    assert skipped_forwards == 3
+
+
+def test_racing_duplicate_particles_with_different_thresholds():
+    parameters = np.array([[100.0], [100.0]])
+    exact_fitness = create_evaluator()(parameters)
+
+    evaluator = create_evaluator(racing_sources=1)
+    fitness = evaluator(parameters, np.array([0.01, 10.0]))
+
+    # The duplicate with the loose threshold must get the real fitness, not the bound of the tight threshold
+    assert evaluator.exact[1]
+    assert np.isclose(fitness[1], exact_fitness[1])
+    assert evaluator.exact[0] or fitness[0] >= 0.01
+
+
+def test_fitness_cache_hits_and_misses():
+    evaluator = create_evaluator()
+    network = evaluator.nn.net
+
+    first_fitness = evaluator(np.array([[10.0], [20.0], [10.0]]))
+    assert first_fitness[0] == first_fitness[2]
+    assert evaluator.cache_statistics() == (1, 2)
+    forwards = network.forwards
+
+    second_fitness = evaluator(np.array([[20.0], [30.0]]))
+    assert second_fitness[0] == first_fitness[1]
+    assert evaluator.cache_statistics() == (2, 3)
+    # Only the new pattern was passed through the network, once per source
+    assert network.forwards - forwards == 4
+
+    uncached_fitness = create_evaluator(fitness_cache_size=0)(np.array([[20.0], [30.0]]))
+    assert np.array_equal(second_fitness, uncached_fitness)
+
+
+def test_fitness_cache_does_not_keep_bounds():
+    evaluator = create_evaluator(racing_sources=1)
+    parameters = np.array([[50.0]])
+
+    bound = evaluator(parameters, np.array([0.0]))
+    assert not evaluator.exact[0]
+
+    fitness = evaluator(parameters, np.array([np.inf]))
+    assert evaluator.exact[0]
+    assert fitness[0] >= bound[0]
+    assert np.isclose(fitness[0], create_evaluator()(parameters)[0])
+
+
+def test_mask_region_gives_the_same_images_as_full_blending():
+    random_state = np.random.RandomState(4)
+    (lower_bounds, upper_bounds) = image_tools.create_fooling_pattern_bounds()
+    parameters = lower_bounds + random_state.rand(20, len(lower_bounds)) * (upper_bounds - lower_bounds)
+    # OpenCV does not draw lines with a thickness of 0
+    for i in range(0, image_tools.NUMBER_OF_LINES):
+        parameters[:, 8 * i + 7 + 3] = np.maximum(parameters[:, 8 * i + 7 + 3], 1)
+    # A blur radius beyond the bounds, so the blurred rows reach far outside the mask
+    parameters[0:5, -1] = 12
+    backgrounds = random_state.randint(0, 256, (3, IMAGE_DIM, IMAGE_DIM, 3)).astype(np.uint8)
+
+    masks = [np.zeros((IMAGE_DIM, IMAGE_DIM, 1), dtype=np.float32) for _ in range(0, 4)]
+    masks[0][0:38] = 255
+    masks[1][40:60, 10:70] = random_state.randint(0, 256, (20, 60, 1))
+    masks[2][:] = 255
+    masks = [mask.astype(np.uint8) for mask in masks[1:3]] + masks
+
+    renderer = image_tools.FoolingPatternRenderer(IMAGE_DIM)
+    full_patterns = [renderer(IMAGE_DIM, param) for param in parameters]
+    for mask in masks:
+        kernel = image_tools.BlendKernel(backgrounds, mask)
+        patterns = renderer.render_many(parameters, rows=kernel.rows)
+
+        for (first_background, last_background) in [(0, 3), (1, 3), (0, 1)]:
+            blended_images = kernel.blend_many(patterns, first_background=first_background,
+                                               last_background=last_background)
+            number_of_backgrounds = last_background - first_background
+            for p in range(0, len(parameters)):
+                for n in range(0, number_of_backgrounds):
+                    expected_image = image_tools.blend(backgrounds[first_background + n], full_patterns[p], mask)
+                    assert np.array_equal(blended_images[p * number_of_backgrounds + n], expected_image)
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+import export_tools
+import image_tools
+
+
+def test_close_raises_save_errors(monkeypatch):
+    saved = list()
+
+    def save_image(image, filename):
+        if 'broken' in filename:
+            raise IOError('Disk full!')
+        saved.append(filename)
+
+    monkeypatch.setattr(image_tools, 'save_image', save_image)
+    exporter = export_tools.ResultExporter()
+    image = np.zeros((4, 4, 3), dtype=np.uint8)
+    exporter.save(image, 'images/first.png')
+    exporter.save(image, 'images/broken.png')
+    exporter.blend_and_save(image, image, np.zeros((4, 4, 1)), 'images/blended.png')
+
+    with pytest.raises(IOError, match='Disk full'):
+        exporter.close()
+    assert sorted(saved) == ['images/blended.png', 'images/first.png']
+
+
+def test_export_best_skips_unchanged_fitness(monkeypatch):
+    saved = list()
+    monkeypatch.setattr(image_tools, 'save_image', lambda image, filename: saved.append(filename))
+    exporter = export_tools.ResultExporter(prefix='images/dodging')
+    (lower_bounds, upper_bounds) = image_tools.create_fooling_pattern_bounds()
+    position = (lower_bounds + upper_bounds) / 2
+
+    exporter.export_best(0, position, 0.5)
+    exporter.export_best(1, position, 0.5)
+    exporter.export_best(2, position, 0.25)
+    exporter.close()
+
+    assert sorted(saved) == ['images/dodging_iteration0_0.5_fooling_pattern.png',
+                             'images/dodging_iteration2_0.25_fooling_pattern.png']
@@ -0,0 +1,45 @@
+import numpy as np
+
+import image_tools
+import neural_network_tools
+
+IMAGE_DIM = neural_network_tools.IMAGE_DIM
+
+
+class FakeNetwork:
+    def __init__(self):
+        """
+        Stands in for openface.TorchNeuralNet: a fixed random projection of the downsampled image to a representation
+        of unit length
+        """
+        self.projection = np.random.RandomState(0).randn(128, (IMAGE_DIM // 8) ** 2 * 3)
+
+    def forward(self, img):
+        rep = np.dot(self.projection, img[::8, ::8].ravel() / 255.0 - 0.5)
+        return rep / np.linalg.norm(rep)
+
+
+def test_report_likenesses_match_single_comparisons():
+    random_state = np.random.RandomState(1)
+    sources = [random_state.randint(0, 256, (IMAGE_DIM, IMAGE_DIM, 3)).astype(np.uint8) for _ in range(0, 3)]
+    targets = [random_state.randint(0, 256, (IMAGE_DIM, IMAGE_DIM, 3)).astype(np.uint8) for _ in range(0, 2)]
+    fooling_pattern = random_state.randint(0, 256, (IMAGE_DIM, IMAGE_DIM, 3)).astype(np.uint8)
+    mask = np.zeros((IMAGE_DIM, IMAGE_DIM, 1), dtype=np.float32)
+    mask[0:38] = 255
+
+    nn = neural_network_tools.NeuralNetworkTools(net=FakeNetwork())
+    report = nn.calculate_report_likenesses(sources, targets, mask, fooling_pattern)
+    fooled_sources = [image_tools.blend(source, fooling_pattern, mask) for source in sources]
+
+    # Ordered by target first and source second, like the per-pair comparisons of the report
+    expected = {'target_target': [nn.calculate_likeness(t, s) for t in targets for s in targets],
+                'source_target': [nn.calculate_likeness(t, s) for t in targets for s in sources],
+                'fooled_target': [nn.calculate_likeness(t, s) for t in targets for s in fooled_sources],
+                'fooled_source': [nn.calculate_likeness(t, s) for t in sources for s in fooled_sources]}
+    for key in expected:
+        assert np.allclose(report[key], expected[key])
+
+    assert np.allclose(report['target_target'], nn.calculate_unmasked_likenesses(targets, targets))
+    assert np.allclose(report['source_target'], nn.calculate_unmasked_likenesses(sources, targets))
+    assert np.allclose(report['fooled_target'], nn.calculate_likenesses(sources, targets, mask, fooling_pattern))
+    assert np.allclose(report['fooled_source'], nn.calculate_likenesses(sources, sources, mask, fooling_pattern))
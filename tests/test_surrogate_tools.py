@@ -0,0 +1,36 @@
+import numpy as np
+
+import surrogate_tools
+
+
+class RacingObjective:
+    def __init__(self):
+        """
+        An objective function like a racing SwarmEvaluator: particles above their threshold only get a bound of 0
+        """
+        self.exact = None
+
+    def __call__(self, swarm_parameters, thresholds=None):
+        fitness = 1 + np.sum(swarm_parameters, axis=1)
+        self.exact = np.ones(len(fitness), dtype=bool)
+        if thresholds is not None:
+            self.exact = fitness < thresholds
+            fitness[~self.exact] = 0.0
+        return fitness
+
+
+def test_surrogate_only_learns_exact_values():
+    evaluator = surrogate_tools.SurrogateScreeningEvaluator(RacingObjective(), [0, 0], [10, 10], 0.5)
+    random_state = np.random.RandomState(0)
+
+    for _ in range(0, 3):
+        swarm_parameters = np.round(random_state.rand(8, 2) * 10)
+        fitness = evaluator(swarm_parameters, np.full(8, 10.0))
+        assert np.all(np.isinf(fitness[~evaluator.exact]) | (fitness[~evaluator.exact] == 0.0))
+
+    # Every learned value is a real objective value, none of the bounds
+    assert len(evaluator.surrogate) > 0
+    assert np.all(evaluator.surrogate.values > 0)
+    (evaluated, skipped, mean_absolute_error) = evaluator.statistics()
+    assert evaluated + skipped == 24
+    assert len(evaluator.absolute_errors) <= evaluated - 8
@@ -0,0 +1,88 @@
+import os
+import tempfile
+
+import numpy as np
+
+import swarm_tools
+
+
+def sphere(positions):
+    return np.sum(positions ** 2, axis=1)
+
+
+def test_early_stop_saves_checkpoint_and_reports_last_iteration():
+    checkpoint_path = os.path.join(tempfile.mkdtemp(), 'checkpoint.npz')
+    iterations = list()
+
+    (g, fg) = swarm_tools.pso(sphere, [-1, -1], [1, 1], swarmsize=10, maxiter=1000, minfunc=1e-2,
+                              random_state=np.random.RandomState(0), checkpoint=checkpoint_path,
+                              callback=lambda iteration, best_position, best_fitness: iterations.append(
+                                  (iteration, best_fitness)))
+
+    # The search stopped early, and the final state was checkpointed and passed to the callback
+    state = swarm_tools.load_checkpoint(checkpoint_path)
+    assert state['iteration'] < 1000
+    assert iterations[-1] == (state['iteration'], fg)
+    assert state['fg'] == fg
+    assert np.array_equal(state['g'], g)
+
+
+def test_checkpoint_round_trip():
+    checkpoint_path = os.path.join(tempfile.mkdtemp(), 'checkpoint.npz')
+    random_state = np.random.RandomState(3)
+    random_state.rand(5)
+    arrays = dict((key, random_state.rand(4, 2)) for key in ['x', 'v', 'p'])
+    (fp, g) = (random_state.rand(4), random_state.rand(2))
+
+    swarm_tools.save_checkpoint(checkpoint_path, arrays['x'], arrays['v'], arrays['p'], fp, g, 0.5, random_state, 7)
+    state = swarm_tools.load_checkpoint(checkpoint_path)
+
+    for key in ['x', 'v', 'p']:
+        assert np.array_equal(state[key], arrays[key])
+    assert np.array_equal(state['fp'], fp)
+    assert np.array_equal(state['g'], g)
+    assert state['fg'] == 0.5
+    assert state['iteration'] == 7
+    assert state['evaluations'] == 4 * 8
+
+    # The random generator continues where it was saved
+    restored_state = np.random.RandomState()
+    restored_state.set_state(state['random_state'])
+    assert np.array_equal(restored_state.rand(3), random_state.rand(3))
+
+
+def test_resume_gives_the_same_result():
+    checkpoint_path = os.path.join(tempfile.mkdtemp(), 'checkpoint.npz')
+    (g, fg) = swarm_tools.pso(sphere, [-1, -1], [1, 1], swarmsize=10, maxiter=5,
+                              random_state=np.random.RandomState(0))
+
+    swarm_tools.pso(sphere, [-1, -1], [1, 1], swarmsize=10, maxiter=2, random_state=np.random.RandomState(0),
+                    checkpoint=checkpoint_path)
+    evaluated = list()
+
+    def counting_sphere(positions):
+        evaluated.append(len(positions))
+        return sphere(positions)
+
+    (resumed_g, resumed_fg) = swarm_tools.pso(counting_sphere, [-1, -1], [1, 1], swarmsize=10, maxiter=5,
+                                              random_state=np.random.RandomState(1), resume=checkpoint_path)
+
+    assert np.array_equal(resumed_g, g)
+    assert resumed_fg == fg
+    # Only the iterations after the checkpoint are evaluated
+    assert evaluated == [10] * 3
+
+
+def test_checkpoint_stores_counted_evaluations():
+    checkpoint_path = os.path.join(tempfile.mkdtemp(), 'checkpoint.npz')
+    evaluated = list()
+
+    def counting_sphere(positions):
+        # Like a surrogate that only evaluates half of the particles
+        evaluated.append(len(positions) // 2)
+        return sphere(positions)
+
+    swarm_tools.pso(counting_sphere, [-1, -1], [1, 1], swarmsize=10, maxiter=3, random_state=np.random.RandomState(0),
+                    checkpoint=checkpoint_path, evaluations=lambda: sum(evaluated))
+
+    assert swarm_tools.load_checkpoint(checkpoint_path)['evaluations'] == 5 * 4
@@ -1,12 +1,20 @@
 import json
 
+# The contents of config.json, read on first use
+_config = None
 
-def load_key_from_config(key):
+
+def load_key_from_config(key, default=None):
     """
-    Loads a key from config.json
+    Loads a key from config.json. The file is only read once per process
     :parameter key the key to load (a string)
+    :parameter default the value for a missing key. If None, the key is required
     :return:
     """
-    json_data = open('config.json').read()
-    config_dict = json.loads(json_data)
-    return config_dict[key]
+    global _config
+    if _config is None:
+        with open('config.json') as config_file:
+            _config = json.load(config_file)
+    if default is not None and key not in _config:
+        return default
+    return _config[key]
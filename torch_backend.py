@@ -0,0 +1,79 @@
+import os
+import subprocess
+
+import numpy as np
+
+BATCH_SERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'batch_server.lua')
+REPRESENTATION_SIZE = 128
+
+
+class BinaryTorchNeuralNet:
+    def __init__(self, model, imgDim=96, cuda=False, server_path=BATCH_SERVER_PATH):
+        """
+        Replacement for openface.TorchNeuralNet. openface writes every image to a temporary file and reads the
+        representation back as text. This class passes raw image bytes and float32 representations through the pipes
+        of batch_server.lua instead, and a whole batch at once
+        :param model: the path of the network model
+        :param imgDim: the size of the images in pixels
+        :param cuda: run the network on the GPU
+        :param server_path: the path of batch_server.lua
+        """
+        self.imgDim = imgDim
+        command = ['/usr/bin/env', 'th', server_path, '-model', model, '-imgDim', str(imgDim)]
+        if cuda:
+            command.append('-cuda')
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0)
+
+    def forward(self, rgbImg):
+        """
+        Calculates the representation of an RGB image
+        :param rgbImg: the image
+        :return: the representation
+        """
+        return self.forward_batch(rgbImg[np.newaxis])[0]
+
+    def forward_batch(self, images):
+        """
+        Calculates the representations of a batch of RGB images
+        :param images: array of shape (K, imgDim, imgDim, 3)
+        :return: a K x 128 matrix containing one representation per row
+        """
+        assert images.ndim == 4 and images.shape[1:] == (self.imgDim, self.imgDim, 3)
+        images = np.ascontiguousarray(images, dtype=np.uint8)
+
+        # The images are written straight from their buffer, and the representations read straight into the result
+        self.process.stdin.write(np.array(len(images), dtype=np.int32).tobytes())
+        self.process.stdin.write(images.data)
+        self.process.stdin.flush()
+
+        representations = np.empty((len(images), REPRESENTATION_SIZE), dtype=np.float32)
+        self.read_into(representations)
+        return representations.astype(np.float64)
+
+    def read_into(self, array):
+        """
+        Fills an array with the bytes written by the server
+        :param array: a contiguous numpy array
+        :return: nothing
+        """
+        buffer_view = memoryview(array.reshape(-1).view(np.uint8))
+        received = 0
+        while received < len(buffer_view):
+            count = self.process.stdout.readinto(buffer_view[received:])
+            if not count:
+                raise Exception('The batch server stopped! Exit code: {}'.format(self.process.poll()))
+            received += count
+
+    def close(self):
+        """
+        Stops the server
+        :return: nothing
+        """
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait()
+
+    def __del__(self):
+        # The process does not exist if it could not be started
+        if hasattr(self, 'process'):
+            self.close()
@@ -0,0 +1,11 @@
+import argparse
+
+import distributed_tools
+
+# Main program start: Argument paring
+parser = argparse.ArgumentParser()
+parser.add_argument('--host', help="Address of the machine running main.py with --coordinator.", default='localhost')
+parser.add_argument('--port', type=int, help="Port given to --coordinator.", required=True)
+args = parser.parse_args()
+
+distributed_tools.run_worker(args.host, args.port)